@@ -39,335 +39,2657 @@ __author__ = 'Logan Orians'
 
 
 import argparse
+import bisect
+import collections
 import contextlib
+import csv
+import datetime
+import hashlib
+import importlib.util
+import io
 import json
 import logging
 import os
 import platform
+import queue
+import sqlite3
 #import re
 import string
+import sys
+import threading
 import time
 import tkinter as tk
 import types
-from typing import Any, TypeVar
+from typing import Any, Callable, TypeVar
 
 import cv2
 import numpy as np
 import openpyxl
 import pytesseract # type: ignore
 
+# Command line paths are relative to this; options_gui chdirs on import
+LAUNCH_DIR = os.getcwd()
+
 import options_gui
 
 # Change working directory for .command executions
 os.chdir(os.path.dirname(__file__))
 
-# Custom Types for Type Checking (mypy)
-TVideoCapture = TypeVar('TVideoCapture', bound=cv2.VideoCapture)
+# Custom Types for Type Checking (mypy)
+TVideoCapture = TypeVar('TVideoCapture', bound=cv2.VideoCapture)
+Record = dict[str, Any] #typed click, from make_record()
+WriteJob = tuple[str, Any, Callable[[], None] | None] #path, image, done
+# generation, ret, frame, frame_index, slot
+DecodedFrame = tuple[int, bool, Any, int, int | None]
+ShownFrame = tuple[int | None, Any, int] #slot, frame, frame_index
+SpriteCache = collections.OrderedDict[tuple, types.SimpleNamespace]
+MatrixEntry = tuple[tuple[int, int], str, np.ndarray] #stamp, hash, matrix
+OcrCache = collections.OrderedDict[bytes, tuple[str, str]]
+PrefetchJob = tuple[int, bytes, np.ndarray] #frame_index, key, corner
+
+# Defaults for options that older .options.json files may not have; kept
+# with options_gui, which checks keys against them and saves them
+OPTION_DEFAULTS = options_gui.OPTION_DEFAULTS
+
+# Playback speed steps for the speed up/down keys
+PLAYBACK_SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+
+# Format of burnt-in DVR timestamp, as 'date time'
+TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+# Typed columns saved next to each spreadsheet (.npz); NaN coordinates and
+# region -1 (OUTSIDE) if not mapped
+RECORD_COLUMNS = {
+    'timestamp': 'datetime64[s]',
+    'frame_index': np.int64,
+    'pixel_x': np.int32, 'pixel_y': np.int32,
+    'x': np.float64, 'y': np.float64, 'z': np.float64,
+    'adjusted_x': np.float64, 'adjusted_y': np.float64,
+    'adjusted_z': np.float64,
+    'region': np.int8, 'adjusted_region': np.int8,
+} # type: dict[str, Any]
+
+# Resolution the default quads and matrices were calibrated at (width, height)
+CALIBRATION_SIZE = (2688, 1520)
+# Default quads for 3D regions: floor, nesting boxes, single/double roost
+DEFAULT_QUADS = [
+    [[1184, 104], [1394, 123], [2475, 1520], [1030, 1520]],
+    [[1049, 125], [0, 1520], [1030, 1520], [1185, 200]],
+    [[1597, 496], [1820, 448], [2469, 1158], [2015, 1337]],
+    [[1250, 55], [1443, 32], [1830, 365], [1511, 448]]
+]
+
+
+class FilePath:
+    def __init__(self, directory: str) -> None:
+        self.directory = self._make_proper_path(directory)
+        self.filename = ''
+        self.writer = None # type: ImageWriter | None
+
+    @staticmethod
+    def _make_proper_path(directory: str) -> str:
+        #lstrip() and rstrip()? needs testing
+        if not directory.endswith('/') and not directory.endswith('\\'):
+            directory += '/'
+        if not os.path.exists(directory): os.makedirs(directory)
+
+        return directory
+
+    def _prevent_filename_overwrite(self) -> None:
+        """Sets next available filename to avoid overwrite at same timestamp."""
+
+        root, ext = os.path.splitext(self.filename) #get name and extension
+        num = 0
+        while (os.path.exists(self.directory + self.filename) or
+               (self.writer is not None and
+                self.writer.is_pending(self.directory + self.filename))):
+            num += 1
+            self.filename = f"{root}_{num}{ext}"
+
+    def __str__(self) -> str:
+        return f"{self.directory}{self.filename}"
+
+
+class Journal():
+    """Append-only log of spreadsheet edits, fsync'd before the sheet changes.
+
+    The journal is removed when its session closes cleanly, and is locked
+    while its session is open, so an unlocked journal left on disk means
+    the session crashed and can be replayed.
+    """
+
+    SUFFIX = '.journal'
+
+    def __init__(self, path: str, headers: list[str]) -> None:
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self.lock(self._file)
+        self.log(headers=headers)
+
+    @staticmethod
+    def lock(f) -> bool:
+        """Takes an exclusive OS lock on an open file, without waiting.
+
+        The OS drops the lock when the process exits, even if it crashed.
+
+        Args:
+            f: open journal file
+
+        Returns:
+            locked: False if another process holds the lock
+        """
+
+        try:
+            if sys.platform == 'win32': #so mypy only checks this on Windows
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def log(self, **event: Any) -> None:
+        """Appends one event and forces it to disk.
+
+        Args:
+            event: append=[row values] (and record), undo=True or redo=True
+        """
+
+        self._file.write(json.dumps(event) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Closes and removes the journal after a clean session end."""
+
+        self._file.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    @staticmethod
+    def replay(f) -> tuple[list[str], list[list[str]],
+                           list[dict[str, Any] | None]]:
+        """Rebuilds spreadsheet contents from a journal.
+
+        Args:
+            f: journal file, open for reading (and locked)
+
+        Returns:
+            headers: spreadsheet column headers
+            rows: rows left after replaying appends, undos and redos
+            records: typed record of each row (None if not logged)
+        """
+
+        headers = [] # type: list[str]
+        rows = [] # type: list[tuple[list[str], dict[str, Any] | None]]
+        redo = [] # type: list[tuple[list[str], dict[str, Any] | None]]
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                break #torn write from the crash; nothing after it
+            if 'headers' in event:
+                headers = event['headers']
+            elif 'append' in event:
+                rows.append((event['append'], event.get('record')))
+                redo.clear()
+            elif 'undo' in event and rows:
+                redo.append(rows.pop())
+            elif 'redo' in event and redo:
+                rows.append(redo.pop())
+
+        return (headers, [row for row, _ in rows],
+                [record for _, record in rows])
+
+
+class SessionStore():
+    """Optional SQLite database holding the records of every session.
+
+    Rows mirror each session's spreadsheet, undo/redo included. They are
+    synced in one transaction per SpreadSheet.flush(), so many sessions
+    can be queried together without opening any .xlsx files.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            video TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS records (
+            session_id INTEGER NOT NULL REFERENCES sessions(id),
+            row_index INTEGER NOT NULL,
+            video TEXT NOT NULL,
+            date TEXT, --YYYY-MM-DD, NULL if timestamp unreadable
+            time TEXT, --HH:MM:SS
+            frame_index INTEGER, pixel_x INTEGER, pixel_y INTEGER,
+            x REAL, y REAL, z REAL,
+            adjusted_x REAL, adjusted_y REAL, adjusted_z REAL,
+            region INTEGER, adjusted_region INTEGER,
+            PRIMARY KEY (session_id, row_index)
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_video ON records(video);
+        CREATE INDEX IF NOT EXISTS idx_records_timestamp
+            ON records(date, time);
+        CREATE INDEX IF NOT EXISTS idx_records_time ON records(time);
+        CREATE INDEX IF NOT EXISTS idx_records_region ON records(region, time);
+        CREATE INDEX IF NOT EXISTS idx_records_adjusted_region
+            ON records(adjusted_region, time);
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Written from ClickPipeline's worker, closed from main; never both
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(self.SCHEMA)
+
+    def start_session(self, name: str, video: str) -> int:
+        """Registers a session, or finds it again (e.g., crash recovery).
+
+        Args:
+            name: session name, same as its spreadsheet filename
+            video: input video path
+
+        Returns:
+            session_id: id of session in database
+        """
+
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO sessions (name, video) VALUES (?, ?)',
+                (name, video))
+            return self._conn.execute('SELECT id FROM sessions WHERE name = ?',
+                                      (name,)).fetchone()[0]
+
+    def sync(self, session_id: int, first_row: int,
+             records: list[dict[str, Any] | None]) -> None:
+        """Replaces a session's rows from first_row on, in one transaction.
+
+        Args:
+            session_id: id from start_session()
+            first_row: index of first changed row
+            records: records of rows first_row onward, from make_record()
+        """
+
+        video = self._conn.execute('SELECT video FROM sessions WHERE id = ?',
+                                   (session_id,)).fetchone()[0]
+        rows = []
+        for row_index, record in enumerate(records, start=first_row):
+            if record is None: continue #row from before records existed
+            date, _, time_of_day = record['timestamp'].partition('T')
+            rows.append((session_id, row_index, video,
+                         date if time_of_day else None, time_of_day or None,
+                         *[record[name] for name in list(RECORD_COLUMNS)[1:]]))
+
+        with self._conn:
+            self._conn.execute(
+                'DELETE FROM records WHERE session_id = ? AND row_index >= ?',
+                (session_id, first_row))
+            self._conn.executemany(
+                f"INSERT INTO records VALUES ({', '.join('?' * 16)})", rows)
+
+    def query(self, region: int | None = None, start_time: str | None = None,
+              end_time: str | None = None, start_date: str | None = None,
+              end_date: str | None = None, video: str | None = None,
+              adjusted: bool = False) -> list[sqlite3.Row]:
+        """Finds records across all sessions.
+
+        For example, all floor positions between 06:00 and 08:00:
+            store.query(CoordinateManager.FLOOR, '06:00:00', '08:00:00')
+
+        Args:
+            region: region index (CoordinateManager.FLOOR, etc.)
+            start_time: earliest time of day, HH:MM:SS (inclusive)
+            end_time: latest time of day, HH:MM:SS (inclusive)
+            start_date: earliest date, YYYY-MM-DD (inclusive)
+            end_date: latest date, YYYY-MM-DD (inclusive)
+            video: input video path
+            adjusted: filter on adjusted_region instead of region
+
+        Returns:
+            rows: matching records, ordered by date and time
+        """
+
+        region_column = 'adjusted_region' if adjusted else 'region'
+        filters = ((f'{region_column} = ?', region), ('time >= ?', start_time),
+                   ('time <= ?', end_time), ('date >= ?', start_date),
+                   ('date <= ?', end_date), ('video = ?', video))
+        used = [(clause, value) for clause, value in filters
+                if value is not None]
+        where = ' AND '.join(clause for clause, _ in used) or '1'
+
+        return self._conn.execute(
+            f'SELECT * FROM records WHERE {where} ORDER BY date, time',
+            [value for _, value in used]).fetchall()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SpreadSheet(FilePath):
+    """Coordinate rows, kept in memory as an undo/redo stack.
+
+    Every edit is first logged to a Journal. The .csv next to the .xlsx is
+    only brought up to date by flush(), which rewrites just the rows that
+    changed since the last flush, at most every flush_interval seconds.
+    The .xlsx, and an .npz of typed columns, are rewritten in one
+    streaming pass every save_interval seconds and when the session closes.
+    """
+
+    def __init__(self, directory: str, fname: str, headers: list[str],
+                 flush_interval: float = 5.0, save_interval: float = 300.0,
+                 journaled: bool = True, store: SessionStore | None = None,
+                 video: str = '') -> None:
+        super().__init__(directory)
+        self.filename = f"{fname}.xlsx"
+        self.csv_path = f"{self.directory}{fname}.csv"
+        self.headers = headers
+        self.npz_path = f"{self.directory}{fname}.npz"
+        self.rows = [] # type: list[list[str]]
+        self.row_ids = [] # type: list[int]
+        self.records = [] # type: list[dict[str, Any] | None]
+        self._redo = [] # type: list[tuple[int, list[str], Record | None]]
+        self.flush_interval = flush_interval
+        self.save_interval = save_interval
+        self.last_flush = self.last_save = time.monotonic()
+        self._row_offsets = [] # type: list[int]
+        self._synced = 0 #rows[:_synced] are unchanged in the .csv
+        self._dirty = False
+        self.store = store
+        self.session_id = -1
+        if store is not None:
+            self.session_id = store.start_session(fname, video)
+        self.journal = None # type: Journal | None
+        if journaled:
+            self.journal = Journal(f"{self.directory}.{fname}{Journal.SUFFIX}",
+                                   headers)
+        self._set_up_spreadsheet(headers)
+
+    @classmethod
+    def recover(cls, directory: str,
+                store: SessionStore | None = None) -> list[str]:
+        """Rebuilds spreadsheets of crashed sessions from their journals.
+
+        Args:
+            directory: spreadsheet folder
+            store: database to bring up to date as well, if used
+
+        Returns:
+            recovered: paths of rebuilt .xlsx files
+        """
+
+        directory = cls._make_proper_path(directory)
+        recovered = []
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith('.') and name.endswith(Journal.SUFFIX)):
+                continue
+            journal_path = directory + name
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                if not Journal.lock(f):
+                    continue #another instance's session is still open
+                headers, rows, records = Journal.replay(f)
+                sheet = None
+                if headers: #else crashed before the journal was set up
+                    sheet = cls(directory, name[1:-len(Journal.SUFFIX)],
+                                headers, journaled=False, store=store)
+                    sheet.rows = rows
+                    sheet.records = records
+                    sheet.row_ids = [-1] * len(rows)
+                    sheet._dirty = True
+                    sheet.close()
+            #only once the sheet is safely rebuilt
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(journal_path)
+            if sheet is not None:
+                recovered.append(str(sheet))
+
+        return recovered
+
+    def _set_up_spreadsheet(self, headers: list[str]):
+        """Sets up the output files; the .xlsx gets bolded column headers.
+
+        Args:
+            headers: the bolded column headers to be written
+        """
+
+        self._csv = open(self.csv_path, 'w', newline='', encoding='utf-8')
+        self._csv_writer = csv.writer(self._csv)
+        self._csv_writer.writerow(headers)
+        self._csv.flush()
+        self._row_offsets.append(self._csv.tell()) #where row 0 starts
+        self.save()
+
+    def append_to_spreadsheet(self, data: list[str], row_id: int = -1,
+                              record: dict[str, Any] | None = None):
+        """Appends input data to spreadsheet.
+
+        Args:
+            data: the coord and timestamp to be appended
+            row_id: id to find the row by later (e.g., ClickPipeline click id)
+            record: same row as typed values, from make_record()
+        """
+
+        if self.journal is not None:
+            self.journal.log(append=data, record=record)
+        self.rows.append(data)
+        self.row_ids.append(row_id)
+        self.records.append(record)
+        self._redo.clear() #new row starts a new branch of history
+        self._dirty = True
+        self.flush()
+
+    def extend_spreadsheet(self, data: list[list[str]],
+                           records: list[dict[str, Any] | None]) -> None:
+        """Appends many rows at once, e.g. from batch mapping.
+
+        Args:
+            data: rows to be appended
+            records: same rows as typed values, from make_record()
+        """
+
+        if self.journal is not None:
+            for row, record in zip(data, records):
+                self.journal.log(append=row, record=record)
+        self.rows.extend(data)
+        self.row_ids.extend([-1] * len(data))
+        self.records.extend(records)
+        self._redo.clear()
+        self._dirty = True
+        self.flush()
+
+    def undo(self) -> list[str] | None:
+        """Removes most recent row, keeping it for redo().
+
+        Returns:
+            row: removed row, or None if there was nothing to undo
+        """
+
+        if not self.rows: return None
+        if self.journal is not None:
+            self.journal.log(undo=True)
+        row = self.rows.pop()
+        self._redo.append((self.row_ids.pop(), row, self.records.pop()))
+        self._synced = min(self._synced, len(self.rows))
+        self._dirty = True
+        self.flush()
+
+        return row
+
+    def redo(self) -> list[str] | None:
+        """Restores most recently undone row.
+
+        Returns:
+            row: restored row, or None if there was nothing to redo
+        """
+
+        if not self._redo: return None
+        if self.journal is not None:
+            self.journal.log(redo=True)
+        row_id, row, record = self._redo.pop()
+        self.rows.append(row)
+        self.row_ids.append(row_id)
+        self.records.append(record)
+        self._dirty = True
+        self.flush()
+
+        return row
+
+    def last_id(self) -> int | None:
+        return self.row_ids[-1] if self.row_ids else None
+
+    def flush(self, force: bool = False) -> None:
+        """Brings the .csv (and, when due, the .xlsx) up to date.
+
+        Args:
+            force: flush now instead of waiting for flush_interval
+        """
+
+        now = time.monotonic()
+        if not self._dirty or (not force and
+                               now - self.last_flush < self.flush_interval):
+            return
+
+        if self.store is not None:
+            self.store.sync(self.session_id, self._synced,
+                            self.records[self._synced:])
+
+        # Cut off rows changed since the last flush, then write the new ones
+        del self._row_offsets[self._synced + 1:]
+        self._csv.seek(self._row_offsets[-1])
+        self._csv.truncate()
+        for row in self.rows[self._synced:]:
+            self._csv_writer.writerow(row)
+            self._row_offsets.append(self._csv.tell())
+        self._csv.flush()
+        self._synced = len(self.rows)
+        self._dirty = False
+        self.last_flush = now
+
+        if force or now - self.last_save > self.save_interval:
+            self.save()
+
+    def save(self) -> None:
+        """Writes the .xlsx in one pass with openpyxl's write-only mode."""
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        header_cells = []
+        for header in self.headers:
+            cell = openpyxl.cell.WriteOnlyCell(ws, value=header)
+            cell.font = openpyxl.styles.Font(bold=True) #make headers bold
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for row in self.rows:
+            ws.append(row)
+
+        # Save next to the old file, then swap, so a crash can't corrupt it
+        tmp_path = f"{self.directory}~{self.filename}"
+        wb.save(tmp_path)
+        os.replace(tmp_path, str(self))
+        self._save_columns()
+        self.last_save = time.monotonic()
+
+    def _save_columns(self) -> None:
+        """Writes typed records as numeric columns to an .npz by the .xlsx.
+
+        Load with np.load(path); each of RECORD_COLUMNS is one array.
+        """
+
+        records = [record for record in self.records if record is not None]
+        columns = {} # type: dict[str, Any]
+        for name, dtype in RECORD_COLUMNS.items():
+            values = [record[name] for record in records]
+            columns[name] = np.array(values, dtype)
+        tmp_path = f"{self.directory}~{os.path.basename(self.npz_path)}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, self.npz_path)
+
+    def close(self) -> None:
+        """Saves the .xlsx and closes the .csv at the end of a session."""
+
+        self._dirty = True #always write final .xlsx
+        self.flush(force=True)
+        self._csv.close()
+        if self.journal is not None:
+            self.journal.close()
+
+
+class ImageWriter():
+    """Encodes and writes images on a small pool of worker threads.
+
+    write() queues a reference to the image and returns; the image must
+    not change until it is written, when the done callback is called. The
+    queue is bounded, so when the disk can't keep up write() blocks
+    (backpressure) instead of holding on to ever more full-resolution
+    frames. close() writes everything still queued.
+    """
+
+    FORMATS = ('jpg', 'png', 'webp')
+
+    def __init__(self, image_format: str = 'jpg', jpeg_quality: int = 95,
+                 png_compression: int = 3, webp_quality: int = 95,
+                 workers: int = 2, queue_size: int = 8) -> None:
+        if image_format not in self.FORMATS:
+            raise ValueError(f'Unknown image format: {image_format}')
+        self.ext = f".{image_format}"
+        self.params = {
+            'jpg': [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality],
+            'png': [cv2.IMWRITE_PNG_COMPRESSION, png_compression],
+            'webp': [cv2.IMWRITE_WEBP_QUALITY, webp_quality],
+        }[image_format]
+        self.written = 0
+        self._pending = set() # type: set[str]
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue(
+            queue_size) # type: queue.Queue[WriteJob | None]
+        self._threads = [threading.Thread(target=self._work,
+                                          name=f'image-writer-{i}',
+                                          daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def write(self, path: str, image,
+              done: Callable[[], None] | None = None) -> None:
+        """Queues image to be written to path; blocks while the queue is full.
+
+        Args:
+            path: output file, ending in self.ext
+            image: image to write; not copied, so don't change it
+            done: called once image is written (or failed to), e.g. to
+                return a pooled frame buffer
+        """
+
+        with self._pending_lock:
+            self._pending.add(path)
+        self._queue.put((path, image, done))
+
+    def is_pending(self, path: str) -> bool:
+        """Whether path is queued but not written yet (doesn't exist yet)."""
+
+        with self._pending_lock:
+            return path in self._pending
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None: break
+            path, image, done = item
+            try:
+                if not cv2.imwrite(path, image, self.params):
+                    raise OSError(f'cv2.imwrite failed for {path}')
+                self.written += 1
+            except Exception as e:
+                logging.getLogger(__name__).error('\nError: %s\n', e,
+                                                  exc_info=True)
+                print(f'***Could not save image: {e}***')
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(path)
+                if done is not None: done()
+
+    def close(self) -> None:
+        """Writes all queued images, then stops workers."""
+
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class AnnotationManager(FilePath):
+    def __init__(self, directory: str) -> None:
+        super().__init__(directory)
+        self.anno_pos = (0, 0)
+        self.anno_text = ''
+        self.enter_time = 0.0
+        self.filename = ''
+        self.frame = None
+        self.frame_index = -1
+        self.shown_frame = None #frame on screen; frame may be ahead of it
+        self.shown_index = -1
+        self.show_anno = False
+        self.timestamp_time = ''
+        self.typing = False
+        self.write_anno = False
+
+    def start_typing(self, x: int, y: int, timestamp_time: str) -> None:
+        self.anno_pos = (x, y)
+        self.anno_text = ''
+        self.enter_time = 0.0
+        ext = self.writer.ext if self.writer is not None else '.jpg'
+        self.filename = f"{timestamp_time.replace(':', '-')}{ext}"
+        self._prevent_filename_overwrite()
+        self.show_anno = True
+        self.timestamp_time = timestamp_time
+        self.typing = True
+        self.write_anno = False
+
+
+class ScreenCapture(FilePath):
+    def __init__(self, directory: str) -> None:
+        super().__init__(directory)
+        self.captured= False
+        self.capture_time = 0.0
+
+    def save_frame(self, frame: Any, timestamp_time: str,
+                   done: Callable[[], None] | None = None) -> None:
+        self.captured = True
+        self.capture_time = time.time()
+        ext = self.writer.ext if self.writer is not None else '.jpg'
+        self.filename = f"{timestamp_time.replace(':', '-')}{ext}"
+        #self._prevent_filename_overwrite()
+        if self.writer is not None:
+            self.writer.write(str(self), frame, done) #returns before encoding
+        else:
+            cv2.imwrite(str(self), frame)
+            if done is not None: done()
+
+
+class FrameReader():
+    """Decodes video frames on a producer thread into a bounded queue.
+
+    The queue holds up to queue_size decoded frames ahead of display.
+    seek() flushes it, and frames decoded before the seek are dropped even
+    if the producer was mid-put. pause() stops decoding; the frames
+    already queued are exactly the ones that come next, so resume() keeps
+    them. With step > 1, only every step-th frame is decoded; the ones in
+    between are only grabbed, skipping retrieve() and its conversion to a
+    BGR image.
+
+    Frames are decoded into a fixed pool of preallocated slots with
+    cap.read(image=slot) rather than into a new array per frame. The
+    last frame read and the history frames before it stay in their slots
+    (a ring, oldest recycled first) so step_back() can show them again
+    without decoding; read() then replays them before going back to new
+    frames. A slot pinned by pin() (e.g., queued for ImageWriter, or on
+    screen while later frames are dropped) goes back to the pool only once
+    it is released.
+    """
+
+    def __init__(self, cap: TVideoCapture, queue_size: int = 8,
+                 step: int = 1, history: int = 0) -> None:
+        self.cap = cap
+        self.decode_time = 0.0 #moving average, seconds per frame
+        self.frames_decoded = 0
+        self.step = step #frames advanced per decoded frame
+        self.index = None # type: SeekIndex | None
+        self.history = history
+        self.replaying = False #last frame read came from history
+        self._queue = queue.Queue(queue_size) # type: queue.Queue[DecodedFrame]
+        self._generation = 0 #bumped by seek(); older frames are stale
+        self._cap_lock = threading.Lock()
+        self._running = threading.Event()
+        self._running.set()
+        self._stopped = False
+        self._at_end = False
+
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # History, frame on screen and the one read after it (if dropped),
+        # queued frames, frame being decoded
+        count = history + 2 + queue_size + 1
+        self._buffer = np.empty((count, height, width, 3), np.uint8)
+        self._slots = list(self._buffer)
+        self._slot_of = {id(view): slot
+                         for slot, view in enumerate(self._slots)}
+        # Last-in, first-out: slots in use stay hot in cache, and queue slots
+        # never needed (queue rarely full) are never touched, so never take up
+        # RAM. History slots are all touched once the ring fills, so the
+        # history costs its full share of rewind_memory_mb.
+        self._free = queue.LifoQueue() # type: queue.LifoQueue[int]
+        for slot in reversed(range(count)):
+            self._free.put(slot)
+        self._pins = collections.Counter() # type: collections.Counter[int]
+        self._retired = set() # type: set[int] #out of use, but still pinned
+        self._pin_lock = threading.Lock()
+        self.allocations = 0 #frames decoded outside the pool
+        self._shown = collections.deque() # type: collections.deque[ShownFrame]
+        self._back = 0 #frames stepped back from newest shown
+        self._new_segment = False #seeked; history doesn't lead to next frame
+
+        self._thread = threading.Thread(target=self._work, name='frame-reader',
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Number of decoded frames waiting to be displayed."""
+
+        return self._queue.qsize()
+
+    @staticmethod
+    def frames_for_budget(cap: TVideoCapture, budget_mb: float,
+                          queue_size: int) -> int:
+        """Works out how many frames of history fit in a memory budget.
+
+        Args:
+            cap: video capture, for frame size
+            budget_mb: memory for all decode slots, in MB
+            queue_size: frames decoded ahead, which also need slots
+
+        Returns:
+            history: frames that can be kept for stepping back (0 if none)
+        """
+
+        frame_bytes = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) *
+                       int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) * 3)
+        if not frame_bytes: return 0
+        return max(0, int(budget_mb * 1e6 // frame_bytes) - queue_size - 3)
+
+    def _take_slot(self) -> int | None:
+        while not self._stopped:
+            with contextlib.suppress(queue.Empty):
+                return self._free.get(timeout=0.1)
+        return None
+
+    def _release(self, slot: int | None) -> None:
+        if slot is None: return
+        with self._pin_lock:
+            if self._pins[slot]:
+                self._retired.add(slot) #freed by the last unpin
+                return
+        self._free.put(slot)
+
+    def pin(self, frame) -> Callable[[], None] | None:
+        """Keeps frame's slot from being reused until the callback is called.
+
+        Args:
+            frame: frame returned by read() or step_back()
+
+        Returns:
+            release: callback (safe from any thread), or None if frame
+                isn't in a pool slot and has to be copied instead
+        """
+
+        slot = self._slot_of.get(id(frame))
+        if slot is None: return None
+        with self._pin_lock:
+            self._pins[slot] += 1
+
+        def release() -> None:
+            with self._pin_lock:
+                self._pins[slot] -= 1
+                if self._pins[slot] or slot not in self._retired: return
+                self._retired.discard(slot)
+            self._free.put(slot)
+
+        return release
+
+    def _work(self) -> None:
+        while not self._stopped:
+            self._running.wait() #blocks while paused
+            if self._at_end: #nothing to decode until a seek
+                time.sleep(0.01)
+                continue
+            slot = self._take_slot()
+            if slot is None: break #stopped
+
+            with self._cap_lock:
+                generation = self._generation
+                start = time.perf_counter()
+                frame_index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+                ret, frame = self.cap.read(image=self._slots[slot])
+                elapsed = time.perf_counter() - start
+                if ret and frame is not self._slots[slot]:
+                    self.allocations += 1 #size changed; OpenCV made new array
+                for _ in range(self.step - 1): #skip frames not shown
+                    if not self.cap.grab(): break
+                self._at_end = not ret
+            self.frames_decoded += 1
+            self.decode_time += (elapsed - self.decode_time) / min(
+                self.frames_decoded, 30)
+
+            while not self._stopped and generation == self._generation:
+                try:
+                    self._queue.put(
+                        (generation, ret, frame, frame_index, slot),
+                        timeout=0.1)
+                    break
+                except queue.Full:
+                    pass #display is behind; wait for room
+            else:
+                self._release(slot) #stale or stopping
+
+    def read(self) -> tuple[bool, Any, int]:
+        """Gets next frame: from history after step_back(), else decoded.
+
+        Waits for the producer if needed.
+
+        Returns:
+            ret: False at end of video
+            frame: decoded frame (BGR), None at end of video
+            frame_index: index of frame in video
+        """
+
+        if self._back:
+            self._back -= 1
+            self.replaying = True
+            _, frame, frame_index = self._shown[-1 - self._back]
+            return True, frame, frame_index
+
+        self.replaying = False
+        while True:
+            generation, ret, frame, frame_index, slot = self._queue.get()
+            if generation == self._generation: break
+            self._release(slot)
+
+        if self._new_segment: #frames before a seek aren't history of this one
+            self._new_segment = False
+            while self._shown:
+                self._release(self._shown.popleft()[0])
+        if not ret:
+            self._release(slot)
+            return ret, None, frame_index
+        self._shown.append((slot, frame, frame_index))
+        while len(self._shown) > self.history + 1: #+1: frame on screen
+            self._release(self._shown.popleft()[0])
+
+        return ret, frame, frame_index
+
+    def step_forward(self) -> tuple[bool, Any, int]:
+        """Reads next frame, even while paused (stays paused)."""
+
+        paused = not self._running.is_set()
+        self._running.set()
+        try:
+            return self.read()
+        finally:
+            if paused: self._running.clear()
+
+    def step_back(self, frames: int = 1) -> tuple[Any, int] | None:
+        """Goes back to a frame shown before, without decoding.
+
+        Args:
+            frames: how many frames to go back; stops at oldest in history
+
+        Returns:
+            frame, frame_index: frame to show, or None if none is kept
+        """
+
+        back = min(self._back + frames, len(self._shown) - 1)
+        if back <= self._back or self._new_segment:
+            return None
+        self._back = back
+        self.replaying = True
+        _, frame, frame_index = self._shown[-1 - back]
+        return frame, frame_index
+
+    def seek(self, frame_index: int) -> None:
+        """Jumps to frame_index, discarding frames decoded ahead.
+
+        Args:
+            frame_index: index of next frame that read() returns
+        """
+
+        with self._cap_lock:
+            self._seek(frame_index)
+
+    def seek_time(self, when: datetime.datetime) -> int | None:
+        """Jumps to first frame showing a DVR time, using the seek index.
+
+        Args:
+            when: DVR date/time to jump to
+
+        Returns:
+            frame_index: index of next frame that read() returns, or None
+                (without seeking) if the index can't place when
+        """
+
+        if self.index is None:
+            return None
+        with self._cap_lock:
+            frame_index = self.index.find_time(self.cap, when)
+            if frame_index is not None:
+                self._seek(frame_index)
+        return frame_index
+
+    def _seek(self, frame_index: int) -> None:
+        self._generation += 1
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self._at_end = False
+        self._back = 0
+        # Frame on screen keeps its slot until the next read() replaces it
+        self._new_segment = True
+        self._drain()
+
+    def _drain(self) -> None:
+        with contextlib.suppress(queue.Empty):
+            while True:
+                self._release(self._queue.get_nowait()[4])
+
+    def pause(self) -> None:
+        self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def stop(self) -> None:
+        """Stops producer thread; call before releasing the capture."""
+
+        self._stopped = True
+        self._running.set()
+        self._drain() #unblock a producer waiting to put
+        self._thread.join()
+
+
+class PlaybackClock():
+    """Paces playback against the monotonic clock.
+
+    Frame n is due n / fps seconds after the frame playback was anchored
+    on, so the time spent decoding, drawing and in imshow comes out of the
+    wait instead of adding to it. A fixed waitKey(1000 / fps) ignored that
+    time and played about 20% slower than real time.
+
+    At speed s, frames are due s times as often. Speeds of 2x and up show
+    every step-th frame (step = int(speed)) instead, so the display rate
+    stays at the video's fps.
+    """
+
+    def __init__(self, fps: float, speed: float = 1.0,
+                 max_drop: int = 5) -> None:
+        if speed <= 0:
+            raise ValueError(f'Playback speed must be positive: {speed}')
+        self.fps = fps
+        self.speed = speed
+        self.max_drop = max_drop #most frames dropped in a row
+        self.shown = 0
+        self.dropped = 0
+        self._played = 0.0 #seconds of playback before current anchor
+        self._start = 0.0
+        self._start_index = -1 #-1 anchors on next scheduled frame
+        self._in_a_row = 0
+
+    def reset(self) -> None:
+        """Stops the clock; playback re-anchors on the next frame.
+
+        Call when pausing or seeking.
+        """
+
+        if self._start_index >= 0:
+            self._played += time.monotonic() - self._start
+        self._start_index = -1
+
+    @property
+    def step(self) -> int:
+        """Frames advanced per frame shown."""
+
+        return max(1, int(self.speed))
+
+    def set_speed(self, speed: float) -> None:
+        if speed <= 0:
+            raise ValueError(f'Playback speed must be positive: {speed}')
+        self.reset() #due times so far were at the old speed
+        self.speed = speed
+
+    def _due(self, frame_index: int) -> float:
+        return self._start + ((frame_index - self._start_index) /
+                              (self.fps * self.speed))
+
+    def _anchor(self, frame_index: int, now: float) -> None:
+        self._start, self._start_index = now, frame_index
+
+    def schedule(self, frame_index: int) -> int:
+        """Works out how long to wait before showing frame_index.
+
+        Args:
+            frame_index: index of frame about to be shown
+
+        Returns:
+            wait: ms to pass to cv2.waitKey (at least 1), or -1 if playback
+                is behind and the frame should be dropped
+        """
+
+        now = time.monotonic()
+        if self._start_index < 0 or frame_index < self._start_index:
+            self._anchor(frame_index, now)
+        late = now - self._due(frame_index)
+        if late > 1: #stalled (e.g. annotating), not slow; don't catch up
+            self._played += self._due(frame_index) - self._start
+            self._anchor(frame_index, now)
+            late = 0
+
+        if (late * self.fps * self.speed > self.step and
+                self._in_a_row < self.max_drop):
+            self._in_a_row += 1
+            self.dropped += 1
+            return -1
+        self._in_a_row = 0
+        self.shown += 1
+        return max(1, round(-late * 1000))
+
+    @property
+    def achieved_fps(self) -> float:
+        """Frames shown per second of playback, excluding pauses."""
+
+        played = self._played
+        if self._start_index >= 0:
+            played += time.monotonic() - self._start
+        return self.shown / played if played > 0 else 0.0
+
+
+class Display():
+    """Renders frames at window size, mapping between window and video pixels.
+
+    With scaling on, each frame is resized once to the window size and
+    overlays are drawn on the small copy, instead of drawing on the
+    full-resolution frame and having HighGUI scale it down on every
+    imshow. Mouse coordinates then come in window pixels and to_source()
+    maps them back to the video pixel under the cursor.
+
+    Text is blended from cached sprites (putText coverage masks of just
+    the text's bounding box), saving only the pixels under each sprite
+    first, so clear() puts the canvas back as it was after imshow. The frame
+    itself (canvas when not scaling) or the cached resize is reused
+    while paused or typing, instead of copying the whole frame to keep
+    it clean.
+    """
+
+    def __init__(self, video_size: tuple[int, int],
+                 window_size: tuple[int, int], scaled: bool = True,
+                 cache_size: int = 64) -> None:
+        self.video_size = video_size
+        self.size = window_size if scaled else video_size
+        self.scaled = self.size != video_size
+        self.fx = video_size[0] / self.size[0] #video pixels per window pixel
+        self.fy = video_size[1] / self.size[1]
+        self.cache_size = cache_size
+        self._sprites = collections.OrderedDict() # type: SpriteCache
+        self._saved = [] # type: list[tuple[int, int, int, int, np.ndarray]]
+        self._key = None # type: tuple[int, int] | None
+        self._canvas = None # type: np.ndarray | None
+
+    def render(self, frame: np.ndarray, frame_index: int) -> np.ndarray:
+        """Gets image to draw overlays on and show.
+
+        Args:
+            frame: video frame
+            frame_index: index of frame in video; the resize is reused
+                while it and frame don't change
+
+        Returns:
+            canvas: frame at window size (frame itself if not scaling)
+        """
+
+        if not self.scaled:
+            return frame
+        key = (id(frame), frame_index)
+        if key != self._key or self._canvas is None: #resize into same canvas
+            self._canvas = cv2.resize(frame, self.size, dst=self._canvas,
+                                      interpolation=cv2.INTER_AREA)
+            self._key = key
+        return self._canvas
+
+    def to_source(self, x: int, y: int) -> tuple[int, int]:
+        """Maps a window pixel to the video pixel under its centre.
+
+        Args:
+            x, y: pixel in window image
+
+        Returns:
+            x, y: pixel in video frame
+        """
+
+        if not self.scaled:
+            return x, y
+        # Pixel centres line up as in cv2.resize: (x + 0.5) * f - 0.5
+        source_x = min(max(round((x + 0.5) * self.fx - 0.5), 0),
+                       self.video_size[0] - 1)
+        source_y = min(max(round((y + 0.5) * self.fy - 0.5), 0),
+                       self.video_size[1] - 1)
+        return source_x, source_y
+
+    def to_window(self, x: int, y: int) -> tuple[int, int]:
+        if not self.scaled:
+            return x, y
+        return (round((x + 0.5) / self.fx - 0.5),
+                round((y + 0.5) / self.fy - 0.5))
+
+    def put_text(self, canvas: np.ndarray, text: str,
+                 position: tuple[int, int],
+                 font: types.SimpleNamespace) -> None:
+        """Draws text at a video pixel position, scaled like the video.
+
+        Args:
+            canvas: image from render()
+            text: text to draw
+            position: bottom-left of text, in video pixels
+            font: font settings for putText
+        """
+
+        scale = font.scale / self.fx
+        thickness = max(1, round(font.thickness / self.fx))
+        sprite = self._sprite(text, font.font, scale, tuple(font.color),
+                              thickness)
+        x, y = self.to_window(*position)
+        left, top = x - sprite.left, y - sprite.top
+
+        # Clip sprite to canvas
+        height, width = canvas.shape[:2]
+        x0, y0 = max(0, left), max(0, top)
+        x1 = min(width, left + sprite.patch.shape[1])
+        y1 = min(height, top + sprite.patch.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return
+        clip = np.s_[y0 - top:y1 - top, x0 - left:x1 - left]
+
+        roi = canvas[y0:y1, x0:x1]
+        self._saved.append((y0, y1, x0, x1, roi.copy()))
+        roi[:] = cv2.blendLinear(sprite.patch[clip], roi, sprite.alpha[clip],
+                                 sprite.beta[clip])
+
+    def _sprite(self, text: str, face: int, scale: float, color: tuple,
+                thickness: int) -> types.SimpleNamespace:
+        """Gets sprite of text, rendering it on first use.
+
+        Returns:
+            sprite: patch (solid color), alpha (putText's anti-aliased
+                coverage) and beta (1 - alpha) weights for blending, and
+                left/top offset of the text origin inside the patch
+        """
+
+        key = (text, face, scale, color, thickness)
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            return sprite
+
+        (text_width, text_height), baseline = cv2.getTextSize(
+            text, face, scale, thickness)
+        pad = thickness + 1 #strokes spill past getTextSize's box
+        shape = (text_height + baseline + 2 * pad, text_width + 2 * pad)
+        mask = np.zeros(shape, np.uint8)
+        cv2.putText(mask, text, (pad, pad + text_height), face, scale, 255,
+                    thickness)
+        alpha = mask.astype(np.float32) / 255
+        patch = np.empty((*shape, 3), np.uint8)
+        patch[:] = color
+        sprite = types.SimpleNamespace(patch=patch, alpha=alpha,
+                                       beta=1 - alpha, left=pad,
+                                       top=pad + text_height)
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.cache_size:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def clear(self, canvas: np.ndarray) -> None:
+        """Restores pixels drawn over by put_text(), once shown.
+
+        Args:
+            canvas: image from render() that put_text() drew on
+        """
+
+        while self._saved:
+            y0, y1, x0, x1, roi = self._saved.pop()
+            canvas[y0:y1, x0:x1] = roi
+
+
+class MatrixCache():
+    """Keeps the .3D_matrices homographies in memory between clicks.
+
+    Files are re-stat'ed at most once per check_interval seconds and only
+    re-read when their mtime/size changes; a changed file whose content hash
+    is unchanged (e.g., touched but not rewritten) is not reloaded.
+    """
+
+    REGION_NAMES = ('floor', 'nb', 'sr', 'dr') #same order as quads
+
+    def __init__(self, directory: str, adjusted: bool,
+                 check_interval: float = 1.0) -> None:
+        self.directory = directory
+        self.check_interval = check_interval
+        self.last_check = time.monotonic()
+        self.prefixes = ('', 'adjusted_') if adjusted else ('',)
+        self._entries = {} # type: dict[str, MatrixEntry]
+
+        start = time.perf_counter()
+        for name in self._filenames():
+            self._load(name)
+        self.load_time = time.perf_counter() - start
+
+    def _filenames(self) -> list[str]:
+        return [f"{prefix}{region}_matrix.npy" for prefix in self.prefixes
+                for region in self.REGION_NAMES]
+
+    def _load(self, name: str) -> bool:
+        """(Re)loads a matrix file if its contents changed.
+
+        Args:
+            name: filename of matrix inside directory
+
+        Returns:
+            True if the matrix was (re)loaded, False if unchanged
+        """
+
+        path = os.path.join(self.directory, name)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+
+        old = self._entries.get(name)
+        if old is not None and old[1] == digest:
+            self._entries[name] = (stamp, digest, old[2]) #touched, not changed
+            return False
+        self._entries[name] = (stamp, digest, np.load(io.BytesIO(data)))
+        return True
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reloads any matrix file that changed on disk since last load.
+
+        Args:
+            force: check now instead of waiting for check_interval
+
+        Returns:
+            changed: True if any matrix was reloaded
+        """
+
+        now = time.monotonic()
+        if not force and now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+
+        changed = False
+        for name in self._filenames():
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue #mid-rewrite by QuadViewer; keep old matrix
+            if (stat.st_mtime_ns, stat.st_size) != self._entries[name][0]:
+                changed |= self._load(name)
+
+        return changed
+
+    def get(self, region: int, adjusted: bool = False) -> np.ndarray:
+        """Gets cached homography for a region.
+
+        Args:
+            region: region index, in quad order
+            adjusted: get matrix for adjusted quads instead of default
+
+        Returns:
+            3x3 homography matrix
+        """
+
+        prefix = 'adjusted_' if adjusted else ''
+        name = f"{prefix}{self.REGION_NAMES[region]}_matrix.npy"
+        return self._entries[name][2]
+
+
+class CoordinateManager():
+    # Quad order in .quads.json: floor, nesting boxes, single/double roost
+    FLOOR, NESTING_BOXES, SINGLE_ROOST, DOUBLE_ROOST = range(4)
+    OUTSIDE = -1 #label for pixels outside every region -> probably a wall
+    # rear double roost takes priority over floor
+    PRIORITY = (DOUBLE_ROOST, FLOOR, NESTING_BOXES, SINGLE_ROOST)
+
+    #camera view:
+    # length: 10.54m
+    # height: 2.57m (end), 2.38m (middle), 2.07m (close)
+    #actual:
+    # length: 12.1m
+    # height: 2.2m
+    # width minus nesting boxes: 3.04m
+    # nesting boxes: 0.51m
+    # Per region, in meters: (x_meas, y_meas, x_offset, y_offset, est_z);
+    # a chicken is a solid 40 cm tall, so halve that for floor/nesting boxes
+    REGION_SCALES = {
+        FLOOR: (3.04, 10.54, 0.51, 0.0, 0.2),
+        NESTING_BOXES: (0.51, 10.54, 0.0, 0.0, 0.2),
+        SINGLE_ROOST: (1.0, 3.54, 0.51 + 2, 7.0, 0.4),
+        DOUBLE_ROOST: (1.0, 6.5, 0.51 + 2, 0.0, 0.6),
+    }
+
+    def __init__(self, three_d: bool | str, quads: bool | np.ndarray,
+                 quads_size: tuple[int, int] = CALIBRATION_SIZE,
+                 matrix_dir: str = '.3D_matrices',
+                 quads_file: str = '.quads.json') -> None:
+        self.coord = () # type: tuple[int, ...]
+        self.click_id = -1
+        self.start_time = 0.0
+        self.three_d = three_d
+        self.quads = quads
+        self.frame_size = CALIBRATION_SIZE
+        self._default_regions = self._compile_regions(DEFAULT_QUADS,
+                                                      CALIBRATION_SIZE)
+        self._adjusted_regions = None # type: types.SimpleNamespace | None
+        self.set_quads(quads, quads_size)
+        self.quads_file = quads_file
+        self.matrices = MatrixCache(matrix_dir, adjusted=quads is not False)
+
+    def set_quads(self, quads: bool | np.ndarray,
+                  quads_size: tuple[int, int] = CALIBRATION_SIZE) -> None:
+        """Recompiles the adjusted regions after a calibration change.
+
+        Args:
+            quads: adjusted quads from .quads.json, or False if default
+            quads_size: video resolution (width, height) quads were drawn on
+        """
+
+        self.quads = quads
+        if quads is False:
+            self._adjusted_regions = None
+        else:
+            self._adjusted_regions = self._compile_regions(quads, quads_size)
+
+    def set_frame_size(self, width: int, height: int) -> None:
+        """Sets resolution of the video being clicked on.
+
+        Args:
+            width: video width, from CAP_PROP_FRAME_WIDTH
+            height: video height, from CAP_PROP_FRAME_HEIGHT
+        """
+
+        self.frame_size = (width, height)
+
+    def refresh_calibration(self) -> None:
+        """Picks up matrices/quads rewritten by QuadViewer during a session."""
+
+        if self.matrices.refresh() and self.quads is not False:
+            quads_dict = get_args_from_file(self.quads_file)
+            quads_size = quads_dict.get('frame_size', CALIBRATION_SIZE)
+            self.set_quads(quads_dict['quads'], tuple(quads_size))
+
+    def set_coord(self, x, y, click_id: int = -1):
+        """Sets on-screen coordinate; cheap enough for the mouse callback.
+
+        Args:
+            x: x-coordinate of click
+            y: y-coordinate of click
+            click_id: ClickPipeline id of click, so clear removes its row
+        """
+
+        self.coord = (x, y)
+        self.click_id = click_id
+        self.start_time = time.time()
+
+    def get_3d(self, x, y) -> tuple[tuple[float, float, float],
+                                    tuple[float, float, float], int, int]:
+        """Maps a click to 3D with the default and adjusted quads.
+
+        Args:
+            x: x-coordinate of click
+            y: y-coordinate of click
+
+        Returns:
+            coord_3d: 3D coordinate, (-1, -1, -1) if not in Floor mode
+            adjusted_3d: same with adjusted quads, (-1, -1, -1) if none
+            region: region of coord_3d (FLOOR, etc.), OUTSIDE if not mapped
+            adjusted_region: region of adjusted_3d, OUTSIDE if not mapped
+        """
+
+        coord_3d = adjusted_3d = (-1.0, -1.0, -1.0)
+        region = adjusted_region = self.OUTSIDE
+        if self.three_d == 'Floor':
+            world, regions = self.map_points([[x, y]])
+            coord_3d, region = tuple(world[0].tolist()), int(regions[0])
+        if self.quads != False:
+            world, regions = self.map_points([[x, y]], adjusted=True)
+            adjusted_3d = tuple(world[0].tolist())
+            adjusted_region = int(regions[0])
+
+        return coord_3d, adjusted_3d, region, adjusted_region
+
+    @staticmethod
+    def _compile_regions(quads, quads_size) -> types.SimpleNamespace:
+        """Precomputes region geometry, done once per calibration.
+
+        Args:
+            quads: corners of floor, nesting box, single and double roost quads
+            quads_size: video resolution (width, height) quads were drawn on
+
+        Returns:
+            regions: quad corners and edges, bounding box sizes, and quads_size
+        """
+
+        quads = np.array(quads, np.float64) #convert to ndarray for operations
+        bb_mins = np.min(quads, axis=1) #[x_min, y_min] of each quad
+        bb_maxes = np.max(quads, axis=1) #[x_max, y_max] of each quad
+        next_corners = np.roll(quads, -1, axis=1) #other end of each edge
+
+        return types.SimpleNamespace(quads=quads, next_corners=next_corners,
+                                     bb_mins=bb_mins, bb_maxes=bb_maxes,
+                                     bb_sizes=bb_maxes - bb_mins,
+                                     size=np.array(quads_size, np.float64))
+
+    def map_points(self, points,
+                   adjusted=False) -> tuple[np.ndarray, np.ndarray]:
+        """Maps many pixels to 3D in one vectorized pass.
+
+        Args:
+            points: N x 2 array of pixel coordinates (x, y)
+            adjusted: use adjusted quads/matrices instead of default
+
+        Returns:
+            world: N x 3 array of 3D coordinates, in meters; -1 if outside
+            regions: N region indices (FLOOR, etc.), OUTSIDE if outside
+        """
+
+        self.refresh_calibration()
+        regions_map = self._default_regions
+        if adjusted:
+            if self._adjusted_regions is None:
+                raise ValueError('No adjusted quads to map with')
+            regions_map = self._adjusted_regions
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        frame_size = np.array(self.frame_size, np.float64)
+        in_frame = np.all((points >= 0) & (points < frame_size), axis=1)
+        # Scale clicks on proxies/other resolutions to calibration pixels
+        points = points * (regions_map.size / frame_size)
+        regions = self._classify(points, regions_map)
+        regions[~in_frame] = self.OUTSIDE
+        world = np.full((len(points), 3), -1.0)
+        homogeneous = np.column_stack((points, np.ones(len(points))))
+
+        for region in self.PRIORITY:
+            in_region = regions == region
+            if not in_region.any():
+                continue
+            (x_meas, y_meas, x_offset, y_offset,
+             est_z) = self.REGION_SCALES[region]
+            bb_x, bb_y = regions_map.bb_sizes[region]
+
+            #normalization
+            matrix = self.matrices.get(region, adjusted)
+            trans_pixels = homogeneous[in_region] @ matrix.T
+            trans_pixels /= trans_pixels[:, 2:]
+
+            #scaling
+            world[in_region, 0] = (trans_pixels[:, 0] * (x_meas / bb_x) +
+                                   x_offset)
+            world[in_region, 1] = (trans_pixels[:, 1] * (y_meas / bb_y) +
+                                   y_offset)
+            world[in_region, 2] = est_z
+
+        return world, regions
+
+    def _classify(self, points: np.ndarray,
+                  regions_map: types.SimpleNamespace) -> np.ndarray:
+        """Classifies points with exact point-in-polygon tests, by priority.
+
+        Args:
+            points: N x 2 array of pixel coordinates (x, y)
+            regions_map: compiled regions from _compile_regions()
+
+        Returns:
+            regions: N region indices, OUTSIDE if outside every region
+        """
+
+        regions = np.full(len(points), self.OUTSIDE, dtype=np.int8)
+        unassigned = np.ones(len(points), dtype=bool)
+
+        for region in self.PRIORITY:
+            # Bounding box rejects most points before the polygon test
+            candidates = unassigned & np.all(
+                (points >= regions_map.bb_mins[region]) &
+                (points <= regions_map.bb_maxes[region]), axis=1)
+            if not candidates.any():
+                continue
+            inside = self._in_polygon(points[candidates],
+                                      regions_map.quads[region],
+                                      regions_map.next_corners[region])
+            hits = np.flatnonzero(candidates)[inside]
+            regions[hits] = region
+            unassigned[hits] = False
+
+        return regions
+
+    @staticmethod
+    def _in_polygon(points: np.ndarray, corners: np.ndarray,
+                    next_corners: np.ndarray) -> np.ndarray:
+        """Even-odd ray casting test; points on an edge count as inside.
+
+        Args:
+            points: N x 2 array of pixel coordinates (x, y)
+            corners: M x 2 polygon corners
+            next_corners: corners rolled by one, so edge i is corners[i]->[i+1]
+
+        Returns:
+            inside: N bools
+        """
+
+        x, y = points[:, :1], points[:, 1:] #N x 1, broadcast against edges
+        x0, y0 = corners[:, 0], corners[:, 1]
+        x1, y1 = next_corners[:, 0], next_corners[:, 1]
+
+        # Count edges crossed by a ray cast to the right of each point
+        straddles = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        crossings = np.count_nonzero(straddles & (x < x_cross), axis=1)
+
+        # Boundary pixels are filled by cv2.fillPoly, so keep them inside
+        cross = (x1 - x0) * (y - y0) - (y1 - y0) * (x - x0)
+        on_edge = (np.isclose(cross, 0.0) &
+                   (x >= np.minimum(x0, x1)) & (x <= np.maximum(x0, x1)) &
+                   (y >= np.minimum(y0, y1)) & (y <= np.maximum(y0, y1)))
+
+        return (crossings % 2 == 1) | on_edge.any(axis=1)
+
+
+class PytesseractEngine():
+    """Runs the tesseract executable once per image (the original path)."""
+
+    name = 'pytesseract'
+
+    def image_to_string(self, image: np.ndarray) -> str:
+        return pytesseract.image_to_string(image, config='--psm 7')
+
+
+class TesserocrEngine():
+    """Keeps one Tesseract instance in process; no temp files or forks.
+
+    Requires the optional tesserocr package.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self) -> None:
+        import tesserocr # type: ignore
+
+        tessdata = None
+        if platform.system() == 'Windows':
+            tessdata = R'C:\Program Files\Tesseract-OCR\tessdata'
+        kwargs = {'path': tessdata} if tessdata else {}
+        self._api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_LINE,
+                                            **kwargs)
+        self._api.SetVariable('tessedit_char_whitelist', '0123456789/: ')
+        self._lock = threading.Lock() #one image at a time per instance
+
+    def image_to_string(self, image: np.ndarray) -> str:
+        height, width = image.shape[:2]
+        with self._lock:
+            # 8-bit grayscale: 1 byte per pixel, width bytes per line
+            self._api.SetImageBytes(np.ascontiguousarray(image).tobytes(),
+                                    width, height, 1, width)
+            return self._api.GetUTF8Text()
+
+
+class TemplateEngine():
+    """Reads the fixed-width DVR clock font by matching glyph templates.
+
+    Glyphs are segmented from the thresholded timestamp by column runs and
+    compared against stored templates by intersection over union. Templates
+    are learned by calibrate() from one frame whose read the user confirmed
+    (the calibrate command), or automatically whenever a read falls back to
+    Tesseract. Automatic learning only uses reads that parse as a timestamp,
+    and a glyph is only learned once samples of it from two different clock
+    readings agree, so one misread can't be stored. A read is ambiguous,
+    and falls back, if any glyph's best match scores under min_score, beats
+    the runner-up by less than min_margin, or the text doesn't parse as a
+    timestamp.
+    """
+
+    name = 'template'
+    CHARS = '0123456789/:'
+
+    def __init__(self, fallback,
+                 templates_file: str = '.timestamp_templates.npz',
+                 min_score: float = 0.8, min_margin: float = 0.1) -> None:
+        self.fallback = fallback
+        self.templates_file = templates_file
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.last_confidence = 0.0
+        self.matched = 0 #reads answered by templates
+        self.fell_back = 0 #reads answered by fallback engine
+        self.templates = {} # type: dict[str, np.ndarray]
+        # Unconfirmed samples, with the key of the clock reading they're from
+        self._candidates = {} # type: dict[str, tuple[bytes, np.ndarray]]
+        if os.path.exists(templates_file):
+            with np.load(templates_file) as saved:
+                self.templates = {chr(int(key[1:])): saved[key]
+                                  for key in saved}
+
+    @staticmethod
+    def _segment(image: np.ndarray) -> tuple[list[np.ndarray], list[int]]:
+        """Splits thresholded timestamp into one cell per glyph.
+
+        Args:
+            image: binary image of timestamp area
+
+        Returns:
+            cells: glyph images, cropped to the line's ink rows
+            centers: x-center of each glyph, in pixels
+        """
+
+        ink = image > 0
+        ink_rows = np.flatnonzero(ink.any(axis=1))
+        if not len(ink_rows):
+            return [], []
+        line = ink[ink_rows[0]:ink_rows[-1] + 1]
+
+        # Runs of columns containing ink are glyphs
+        columns = np.concatenate(([0], line.any(axis=0).view(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(columns))
+        starts, ends = edges[::2], edges[1::2]
+        cells = [line[:, start:end] for start, end in zip(starts, ends)]
+        centers = ((starts + ends) // 2).tolist()
+
+        return cells, centers
+
+    def _to_template(self, cell: np.ndarray,
+                     shape: tuple[int, int]) -> np.ndarray:
+        """Centers glyph in a fixed-size cell so narrow glyphs keep shape."""
+
+        height, width = shape
+        if cell.shape[0] != height or cell.shape[1] > width:
+            scaled_width = round(cell.shape[1] * height / cell.shape[0])
+            new_width = min(width, max(1, scaled_width))
+            cell = cv2.resize(cell.view(np.uint8), (new_width, height),
+                              interpolation=cv2.INTER_NEAREST).astype(bool)
+        template = np.zeros(shape, dtype=bool)
+        left = (width - cell.shape[1]) // 2
+        template[:, left:left + cell.shape[1]] = cell
+
+        return template
+
+    def _template_shape(self) -> tuple[int, int]:
+        return next(iter(self.templates.values())).shape
+
+    @staticmethod
+    def _parses(text: str) -> bool:
+        try:
+            datetime.datetime.strptime(text.strip(), TIMESTAMP_FORMAT)
+        except ValueError:
+            return False
+        return True
+
+    def _samples(self, image: np.ndarray, text: str) -> dict[str, np.ndarray]:
+        """Cuts one template per character out of a read timestamp.
+
+        Args:
+            image: binary image of timestamp area
+            text: read of image
+
+        Returns:
+            samples: template of each character, empty if text doesn't
+                parse or segmentation didn't line up with it
+        """
+
+        if not self._parses(text):
+            return {} #misread; don't learn from it
+        text = text.replace(' ', '').strip()
+        cells, _ = self._segment(image)
+        if len(cells) != len(text) or not set(text) <= set(self.CHARS):
+            return {}
+
+        known = list(self.templates.values()) or [
+            template for _, template in self._candidates.values()]
+        if known:
+            shape = known[0].shape
+        else:
+            shape = (cells[0].shape[0], max(cell.shape[1] for cell in cells))
+        samples = {} # type: dict[str, np.ndarray]
+        for char, cell in zip(text, cells):
+            if char not in samples:
+                samples[char] = self._to_template(cell, shape)
+
+        return samples
+
+    def _save(self) -> None:
+        saved = {} # type: dict[str, Any]
+        for char, tmpl in self.templates.items():
+            saved[f"c{ord(char)}"] = tmpl
+        np.savez(self.templates_file, **saved)
+
+    def calibrate(self, image: np.ndarray, text: str) -> int:
+        """Learns glyph templates from one timestamp the user confirmed.
+
+        Trusts text, so templates already learned for its characters are
+        replaced.
+
+        Args:
+            image: binary image of timestamp area
+            text: confirmed timestamp shown in image
+
+        Returns:
+            learned: number of characters learned (0 if text doesn't parse
+                or segmentation didn't line up with it)
+        """
+
+        samples = self._samples(image, text)
+        if samples:
+            self.templates.update(samples)
+            self._save()
+
+        return len(samples)
+
+    def _learn(self, image: np.ndarray, text: str) -> int:
+        """Learns glyphs from a fallback read once two clock readings agree.
+
+        A glyph is only learned when a sample from an earlier read of a
+        different clock reading (another key) agrees with it, so reading
+        the same misread image twice can't confirm it.
+
+        Args:
+            image: binary image of timestamp area
+            text: fallback's read of image
+
+        Returns:
+            learned: number of new characters learned
+        """
+
+        key = TimestampReader.key(image)
+        learned = 0
+        for char, template in self._samples(image, text).items():
+            if char in self.templates:
+                continue
+            candidate_key, candidate = self._candidates.get(char, (b'', None))
+            if candidate_key == key:
+                continue #same clock reading can't confirm itself
+            if candidate is not None:
+                union = (candidate | template).sum()
+                overlap = (candidate & template).sum() / max(union, 1)
+                if overlap >= self.min_score:
+                    self.templates[char] = candidate
+                    del self._candidates[char]
+                    learned += 1
+                    continue
+            self._candidates[char] = (key, template)
+
+        if learned:
+            self._save()
+
+        return learned
+
+    def match(self, image: np.ndarray) -> tuple[str, float]:
+        """Reads timestamp using templates only.
+
+        Args:
+            image: binary image of timestamp area
+
+        Returns:
+            text: timestamp text, date and time separated by a space
+            confidence: lowest per-glyph score, 0 if ambiguous
+        """
+
+        cells, centers = self._segment(image)
+        if not cells or len(self.templates) < 2:
+            return '', 0.0
+
+        shape = self._template_shape()
+        chars = list(self.templates)
+        templates = np.stack([self.templates[char] for char in chars])
+        glyphs = np.stack([self._to_template(cell, shape) for cell in cells])
+
+        # Intersection over union of every glyph against every template
+        glyphs = glyphs.reshape(len(cells), -1).astype(np.float32)
+        templates = templates.reshape(len(chars), -1).astype(np.float32)
+        inter = glyphs @ templates.T
+        union = (glyphs.sum(axis=1)[:, None] + templates.sum(axis=1)[None, :] -
+                 inter)
+        scores = inter / np.maximum(union, 1)
+
+        order = np.argsort(scores, axis=1)
+        best = scores[np.arange(len(cells)), order[:, -1]]
+        runner_up = scores[np.arange(len(cells)), order[:, -2]]
+        if (best.min() < self.min_score or
+                (best - runner_up).min() < self.min_margin):
+            return '', 0.0
+
+        # Fixed-width font: a double-width gap between glyphs is the space
+        pitch = np.median(np.diff(centers)) if len(centers) > 1 else 0
+        text = chars[order[0, -1]]
+        for i in range(1, len(cells)):
+            if centers[i] - centers[i - 1] > 1.5 * pitch:
+                text += ' '
+            text += chars[order[i, -1]]
+        if not self._parses(text):
+            return '', 0.0 #e.g., missed the space; let the fallback read it
+
+        return text, float(best.min())
+
+    def image_to_string(self, image: np.ndarray) -> str:
+        text, self.last_confidence = self.match(image)
+        if self.last_confidence:
+            self.matched += 1
+            return text
+
+        # Ambiguous or unknown glyph: ask Tesseract, and learn from it
+        self.fell_back += 1
+        text = self.fallback.image_to_string(image)
+        self._learn(image, text)
+        return text
+
+
+def make_ocr_engine(
+        backend: str) -> PytesseractEngine | TesserocrEngine | TemplateEngine:
+    """Creates the OCR engine for timestamps, once per session.
+
+    Args:
+        backend: 'auto' (tesserocr if installed), 'tesserocr', 'pytesseract',
+            or 'template' (glyph templates, with 'auto' as fallback)
+
+    Returns:
+        engine: object with image_to_string(image) -> str
+    """
+
+    if backend == 'template':
+        return TemplateEngine(make_ocr_engine('auto'))
+    if backend in ('auto', 'tesserocr'):
+        try:
+            return TesserocrEngine()
+        except (ImportError, RuntimeError) as e:
+            if backend == 'tesserocr':
+                raise
+            print(f'tesserocr unavailable ({e}); using pytesseract for OCR')
+    elif backend != 'pytesseract':
+        raise ValueError(f'Unknown OCR backend: {backend}')
+
+    return PytesseractEngine()
+
+
+class TimestampReader():
+    """Reads burnt-in timestamps, memoizing OCR results.
 
+    The DVR clock only changes once per second (25 frames at 25 fps), so
+    results are cached on a hash of the thresholded timestamp area with
+    least-recently-used eviction.
+    """
 
-class FilePath:
-    def __init__(self, directory: str) -> None:
-        self.directory = self._make_proper_path(directory)
-        self.filename = ''
+    def __init__(self, engine, cache_size: int = 128) -> None:
+        self.engine = engine
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict() # type: OcrCache
+        self._lock = threading.Lock() #shared with TimestampPrefetcher thread
 
     @staticmethod
-    def _make_proper_path(directory: str) -> str:
-        #lstrip() and rstrip()? needs testing
-        if not directory.endswith('/') and not directory.endswith('\\'):
-            directory += '/'
-        if not os.path.exists(directory): os.makedirs(directory)
+    def key(timestamp_thresh: np.ndarray) -> bytes:
+        """Fast hash of thresholded timestamp area; changes when clock ticks"""
 
-        return directory
+        return hashlib.blake2b(timestamp_thresh.tobytes(),
+                               digest_size=16).digest()
 
-    def _prevent_filename_overwrite(self) -> None:
-        """Sets next available filename to avoid overwrite at same timestamp."""
+    def observe(self, frame, frame_index: int) -> None:
+        """Called for each decoded frame; nothing to track when OCRing all."""
 
-        root, ext = os.path.splitext(self.filename) #get name and extension
-        num = 0
-        while os.path.exists(self.directory + self.filename):
-            num += 1
-            self.filename = f"{root}_{num}{ext}"
+    def read(self, frame, frame_index: int = -1) -> tuple[str, str]:
+        """Gets timestamp of frame, only running OCR on a cache miss.
 
-    def __str__(self) -> str:
-        return f"{self.directory}{self.filename}"
+        Args:
+            frame: video frame
+            frame_index: index of frame in video (unused; see
+                TimestampExtrapolator)
 
+        Returns:
+            timestamp_date: date from timestamp, DD/MM/YYYY
+            timestamp_time: time from timestamp, HH:MM:SS
+        """
 
-class SpreadSheet(FilePath):
-    def __init__(self, directory: str, fname: str, headers: list[str]) -> None:
-        super().__init__(directory)
-        self.filename = f"{fname}.xlsx"
-        self._set_up_spreadsheet(headers)
+        timestamp_thresh = threshold_timestamp(frame)
+        key = self.key(timestamp_thresh)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key) #mark most recently used
+                return self._cache[key]
 
-    def _set_up_spreadsheet(self, headers: list[str]):
-        """Sets up the output spreadsheet by adding bolded headers to columns.
+            timestamp = ocr_timestamp(timestamp_thresh, self.engine)
+            self._cache[key] = timestamp
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False) #evict least recently used
+
+        return timestamp
+
+
+class TimestampPrefetcher():
+    """Reads timestamps of decoded frames on a worker thread, ahead of clicks.
+
+    observe() hands the timestamp area of each frame where the clock ticks
+    (about once per second of video) to the worker, which OCRs it into a
+    frame-index table. read() then only looks up the latest prefetched
+    frame at or before the clicked one, and only OCRs on the calling
+    thread if the worker hasn't got there yet.
+    """
+
+    def __init__(self, reader: TimestampReader,
+                 table_size: int = 4096) -> None:
+        self.reader = reader
+        self.table_size = table_size
+        self.hits = 0
+        self.misses = 0
+        self._indices = [] # type: list[int]
+        self._table = {} # type: dict[int, tuple[bytes, tuple[str, str]]]
+        self._table_lock = threading.Lock()
+        self._last_key = b''
+        self._queue = queue.Queue(8) # type: queue.Queue[PrefetchJob | None]
+        self._thread = threading.Thread(target=self._work,
+                                        name='timestamp-prefetch', daemon=True)
+        self._thread.start()
+
+    def key(self, timestamp_thresh: np.ndarray) -> bytes:
+        return self.reader.key(timestamp_thresh)
+
+    def observe(self, frame, frame_index: int) -> None:
+        """Queues frame for OCR if its clock differs from the last queued one.
 
         Args:
-            headers: the bolded column headers to be written
+            frame: video frame
+            frame_index: index of frame in video
         """
 
-        with contextlib.closing(openpyxl.workbook.Workbook()) as wb:
-            ws = wb.active
-            ws.append(headers) # type: ignore[union-attr]
-            for cell in ws['1:1']: # type: ignore[index]
-                cell.font = openpyxl.styles.Font(bold=True) #make headers bold
-            wb.save(str(self))
-
-    def append_to_spreadsheet(self, data: list[str]):
-        """Appends input data to spreadsheet.
+        self.reader.observe(frame, frame_index)
+        key = self.key(threshold_timestamp(frame))
+        if key == self._last_key:
+            return
+        try:
+            # Only the timestamp corner is needed; don't hold on to the frame
+            corner = frame[:100, :634].copy()
+            self._queue.put_nowait((frame_index, key, corner))
+            self._last_key = key
+        except queue.Full:
+            pass #worker is behind; try again on the next frame
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None: break
+            frame_index, key, corner = item
+            try:
+                timestamp = self.reader.read(corner)
+            except Exception: #unreadable frame; the click path will retry
+                continue
+            with self._table_lock:
+                bisect.insort(self._indices, frame_index)
+                self._table[frame_index] = (key, timestamp)
+                if len(self._indices) > self.table_size:
+                    del self._table[self._indices.pop(0)]
+
+    def read(self, frame, frame_index: int = -1) -> tuple[str, str]:
+        """Gets timestamp of frame from the prefetched table if available.
 
         Args:
-            data: the coord and timestamp to be appended
+            frame: video frame
+            frame_index: index of frame in video
+
+        Returns:
+            timestamp_date: date from timestamp, DD/MM/YYYY
+            timestamp_time: time from timestamp, HH:MM:SS
         """
 
-        with contextlib.closing(openpyxl.load_workbook(str(self))) as wb:
-            wb.active.append(data) # type: ignore[union-attr]
-            wb.save(str(self))
+        with self._table_lock:
+            pos = bisect.bisect_right(self._indices, frame_index)
+            entry = self._table[self._indices[pos - 1]] if pos else None
+        # Same second as the prefetched frame only if the clock area matches
+        key = self.key(threshold_timestamp(frame))
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
 
-    def delete_last_coordinate(self):
-        """Deletes most recent coordinate from Excel sheet."""
+        self.misses += 1
+        return self.reader.read(frame)
 
-        with contextlib.closing(openpyxl.load_workbook(str(self))) as wb:
-            ws = wb.active
-            last_row = ws.max_row
-            ws.delete_rows(last_row)
-            wb.save(str(self))
+    def stop(self) -> None:
+        """Stops worker thread after it finishes queued frames."""
 
+        self._queue.put(None)
+        self._thread.join()
 
-class AnnotationManager(FilePath):
-    def __init__(self, directory: str) -> None:
-        super().__init__(directory)
-        self.anno_pos = (0, 0)
-        self.anno_text = ''
-        self.enter_time = 0.0
-        self.filename = ''
-        self.frame = None
-        self.show_anno = False
-        self.timestamp_time = ''
-        self.typing = False
-        self.write_anno = False
 
-    def start_typing(self, x: int, y: int, timestamp_time: str) -> None:
-        self.anno_pos = (x, y)
-        self.anno_text = ''
-        self.enter_time = 0.0
-        self.filename = f"{timestamp_time.replace(':', '-')}.jpg"
-        self._prevent_filename_overwrite()
-        self.show_anno = True
-        self.timestamp_time = timestamp_time
-        self.typing = True
-        self.write_anno = False
+class TimestampExtrapolator():
+    """Gets timestamps from frame index and FPS, anchored on an OCR read.
 
+    The first read is OCR'd and becomes the anchor; later reads are
+    extrapolated from it. A clock tick (change of the timestamp area) seen
+    by observe() pins the anchor to a whole second. Reads are verified by
+    OCR every verify_interval seconds of video, or after a tick lands more
+    than tolerance_frames away from where extrapolation expects it (a DVR
+    frame drop), and re-anchored if they drifted by a second or more.
 
-class ScreenCapture(FilePath):
-    def __init__(self, directory: str) -> None:
-        super().__init__(directory)
-        self.captured= False
-        self.capture_time = 0.0
+    When playing at 2x and up, observe() only sees every step-th frame, so
+    a tick is only known to within step frames. Such ticks never pin the
+    anchor, and are only checked for drops if step <= tolerance_frames;
+    otherwise the next read is OCR'd instead.
+    observe() and read() may be called from different threads.
+    """
 
-    def save_frame(self, frame: Any, timestamp_time: str) -> None:
-        self.captured = True
-        self.capture_time = time.time()
-        self.filename = f"{timestamp_time.replace(':', '-')}.jpg"
-        #self._prevent_filename_overwrite()
-        cv2.imwrite(str(self), frame)
+    def __init__(self, reader: TimestampReader | TimestampPrefetcher,
+                 fps: float, verify_interval: float = 60.0,
+                 tolerance_frames: int = 2) -> None:
+        self.reader = reader
+        self.fps = fps
+        self.verify_frames = verify_interval * fps
+        self.tolerance_frames = tolerance_frames
+        self.step = 1 #frames between observed frames; set with playback speed
+        self.anchor_index = -1
+        self.anchor_time = None # type: datetime.datetime | None
+        self.on_second = False #anchor_time is exactly on a clock tick
+        self.verified_index = -1
+        self.needs_verify = True
+        self.ocr_reads = 0
+        self.extrapolated_reads = 0
+        self._last_key = b''
+        self._last_index = -1
+        self._lock = threading.Lock() #guards the anchor, not OCR
+
+    def _extrapolate(self, frame_index: int) -> datetime.datetime:
+        if self.anchor_time is None:
+            raise RuntimeError('No anchor to extrapolate from yet')
+        seconds = (frame_index - self.anchor_index) / self.fps
+        return self.anchor_time + datetime.timedelta(seconds=seconds)
+
+    def _anchor(self, frame_index: int, anchor_time: datetime.datetime,
+                on_second: bool) -> None:
+        self.anchor_index = frame_index
+        self.anchor_time = anchor_time
+        self.on_second = on_second
+        self.verified_index = frame_index
+        self.needs_verify = False
+
+    def observe(self, frame, frame_index: int) -> None:
+        """Watches for clock ticks on each decoded frame to catch frame drops.
 
+        Args:
+            frame: video frame
+            frame_index: index of frame in video
+        """
 
-class CoordinateManager():
-    def __init__(self, three_d: bool | str, quads: bool | np.ndarray) -> None:
-        self.coord = () # type: tuple[int, ...]
-        self.start_time = 0.0
-        self.three_d = three_d
-        self.coord_3d = (-1.0, -1.0, -1.0)
-        self.quads = quads
-        self.adjusted_3d = (-1.0, -1.0, -1.0)
+        self.reader.observe(frame, frame_index)
+        key = self.reader.key(threshold_timestamp(frame))
+        with self._lock:
+            self._observe(key, frame_index)
+
+    def _observe(self, key: bytes, frame_index: int) -> None:
+        gap = frame_index - self._last_index #tick was in the last gap frames
+        ticked = 0 < gap <= max(1, self.step) and key != self._last_key
+        self._last_key, self._last_index = key, frame_index
+        if not ticked or self.anchor_time is None:
+            return
+        if gap > (self.tolerance_frames if self.on_second else 1):
+            self.needs_verify = True #too coarse to pin or check the tick
+            return
+
+        tick_time = self._extrapolate(frame_index)
+        if not self.on_second:
+            # Clock read at anchor was floored; true tick is the next second
+            whole = tick_time.replace(microsecond=0)
+            if tick_time.microsecond:
+                whole += datetime.timedelta(seconds=1)
+            self._anchor(frame_index, whole, on_second=True)
+            return
+
+        # Ticks should land on whole seconds; otherwise frames were dropped
+        offset = tick_time.microsecond / 1e6
+        off_by = min(offset, 1 - offset) * self.fps
+        if off_by > self.tolerance_frames:
+            self.needs_verify = True
+
+    def read(self, frame, frame_index: int) -> tuple[str, str]:
+        """Gets timestamp of frame, only running OCR to anchor or verify.
 
-    def set_coord(self, x, y):
-        self.coord = (x, y)
-        if self.three_d == 'Floor':
-            self.coord_3d = self._get_3d_from_2d(x, y)
-        if self.quads != False:
-            self.adjusted_3d = self._get_3d_from_2d(x, y, self.quads)
+        Args:
+            frame: video frame
+            frame_index: index of frame in video
 
+        Returns:
+            timestamp_date: date from timestamp, DD/MM/YYYY
+            timestamp_time: time from timestamp, HH:MM:SS
+        """
+
+        with self._lock:
+            since_verified = abs(frame_index - self.verified_index)
+            if (self.anchor_time is not None and not self.needs_verify and
+                    since_verified < self.verify_frames):
+                self.extrapolated_reads += 1
+                timestamp_date, timestamp_time = self._extrapolate(
+                    frame_index).strftime(TIMESTAMP_FORMAT).split(' ')
+                return timestamp_date, timestamp_time
+            self.ocr_reads += 1
+
+        # OCR without the lock, so observe() doesn't wait on it
+        timestamp_date, timestamp_time = self.reader.read(frame, frame_index)
+        try:
+            ocr_time = datetime.datetime.strptime(
+                f"{timestamp_date} {timestamp_time}", TIMESTAMP_FORMAT)
+        except ValueError:
+            return timestamp_date, timestamp_time #unparseable; don't anchor
+
+        with self._lock:
+            self._verify(frame_index, ocr_time)
+        return timestamp_date, timestamp_time
+
+    def _verify(self, frame_index: int, ocr_time: datetime.datetime) -> None:
+        if self.anchor_time is None:
+            self._anchor(frame_index, ocr_time, on_second=False)
+        else:
+            expected = self._extrapolate(frame_index).replace(microsecond=0)
+            drift = expected - ocr_time
+            if abs(drift.total_seconds()) >= 1: #re-anchor
+                print(f"Timestamp drifted {drift.total_seconds():+.0f} s; "
+                      "re-anchoring")
+                self._anchor(frame_index, ocr_time, on_second=False)
+            else:
+                self.verified_index = frame_index
+                self.needs_verify = False
+
+
+class SeekIndex():
+    """Keyframe table and timestamp anchors for one video, cached on disk.
+
+    Jumps to a frame are left to CAP_PROP_POS_FRAMES, which already seeks
+    to the keyframe before it and decodes forward; doing that again from
+    the table only made jumps slower. The keyframes only tell batch_map()
+    whether jumping beats grab()bing through a gap.
+
+    The table is built once by scanning the video and saved as
+    <directory>/<video hash>.npz. The scan uses the optional PyAV package to
+    list keyframes from the demuxer and decodes only keyframes; every
+    anchor_interval seconds of video, one is OCR'd into a (frame index, DVR
+    time) anchor for find_time(). Without PyAV, the scan grab()s every frame
+    for anchors only.
+    """
+
+    def __init__(self, video: str, directory: str = '.seek_index') -> None:
+        self.video = video
+        self.path = os.path.join(directory, f"{self.video_hash(video)}.npz")
+        self.table = None # type: types.SimpleNamespace | None
+        self._builder = None # type: threading.Thread | None
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                self.table = types.SimpleNamespace(**data)
+
+    @staticmethod
+    def keyframes_available() -> bool:
+        """Whether build() can use PyAV, which only decodes keyframes."""
+
+        return importlib.util.find_spec('av') is not None
 
     @staticmethod
-    def _get_3d_from_2d(x, y, quads=None) -> tuple[float, float, float]:
-        #camera view:
-        # length: 10.54m
-        # height: 2.57m (end), 2.38m (middle), 2.07m (close)
-        #actual:
-        # length: 12.1m
-        # height: 2.2m
-        # width minus nesting boxes: 3.04m
-        # nesting boxes: 0.51m
-
-        #real-world measurements, in meters
-        x_meas = 3.04 #total floor width without nesting boxes
-        y_meas = 10.54 #total floor length without nesting boxes
-        nesting_boxes = 0.51
-
-        
-
-        if quads is not None:
-            quads = np.array(quads, np.int32) #convert to ndarray for operations
-            x_vals = quads[:, :, 0] #get x values of each corner of each quad
-            y_vals = quads[:, :, 1] #get y values of each corner of each quad
-            x_mins = np.min(x_vals, axis=1)
-            x_maxes = np.max(x_vals, axis=1)
-            y_mins = np.min(y_vals, axis=1)
-            y_maxes = np.max(y_vals, axis=1)
-
-            # Unpack quads to get corners
-            vertices_floor, vertices_nb, vertices_sr, vertices_dr = quads
-
-            # Unpack mins and maxes
-            floor_bb_x_min, nb_bb_x_min, sr_bb_x_min, dr_bb_x_min = x_mins
-            floor_bb_x_max, nb_bb_x_max, sr_bb_x_max, dr_bb_x_max = x_maxes
-            floor_bb_y_min, nb_bb_y_min, sr_bb_y_min, dr_bb_y_min = y_mins
-            floor_bb_y_max, nb_bb_y_max, sr_bb_y_max, dr_bb_y_max = y_maxes
-
-            # Load transformation matrices
-            matrix_dr = np.load('.3D_matrices/adjusted_dr_matrix.npy')
-            matrix_floor = np.load('.3D_matrices/adjusted_floor_matrix.npy')
-            matrix_nb = np.load('.3D_matrices/adjusted_nb_matrix.npy')
-            matrix_sr = np.load('.3D_matrices/adjusted_sr_matrix.npy')
+    def video_hash(path: str, chunk: int = 1 << 20) -> str:
+        """Hashes size and first/last MiB, so multi-GB files hash instantly.
+
+        Args:
+            path: path of video file
+            chunk: bytes hashed from each end
+
+        Returns:
+            hex digest identifying the video
+        """
+
+        size = os.path.getsize(path)
+        digest = hashlib.sha1(str(size).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read(chunk))
+            f.seek(max(0, size - chunk))
+            digest.update(f.read(chunk))
+        return digest.hexdigest()
+
+    def build(self, reader: TimestampReader,
+              anchor_interval: float = 10.0) -> None:
+        """Scans video once and saves the table.
+
+        Args:
+            reader: timestamp reader used for anchors
+            anchor_interval: seconds of video between timestamp anchors
+        """
 
+        start = time.perf_counter()
+        try:
+            import av # type: ignore
+        except ImportError:
+            table = self._scan_cv2(reader, anchor_interval)
         else:
-            vertices_floor = np.array([[1184, 104], [1394, 123],
-                                   [2475, 1520], [1030, 1520]], np.int32)
-            vertices_nb = np.array([[1049, 125], [1185, 200],
-                                [1030, 1520], [0, 1520]], np.int32)
-            vertices_sr = np.array([[1597, 496], [1820, 448],
-                                [2469, 1158], [2015, 1337]], np.int32)
-            vertices_dr = np.array([[1250, 55], [1443, 32],
-                                [1830, 365], [1511, 448]], np.int32)
-
-            #floor bounding box mins/maxes, in pixels
-            floor_bb_x_min = 1030
-            floor_bb_x_max = 2475
-            floor_bb_y_min = 104
-            floor_bb_y_max = 1520
-            #nesting boxes bounding box mins/maxes, in pixels
-            nb_bb_x_min = 0
-            nb_bb_x_max = 1185
-            nb_bb_y_min = 125
-            nb_bb_y_max = 1520
-            #single roost bounding box mins/maxes, in pixels
-            sr_bb_x_min = 1597
-            sr_bb_x_max = 2469
-            sr_bb_y_min = 448
-            sr_bb_y_max = 1337
-            #double roost bounding box mins/maxes, in pixels
-            dr_bb_x_min = 1250
-            dr_bb_x_max = 1830
-            dr_bb_y_min = 32
-            dr_bb_y_max = 448
-
-            matrix_dr = np.load('.3D_matrices/dr_matrix.npy')
-            matrix_floor = np.load('.3D_matrices/floor_matrix.npy')
-            matrix_nb = np.load('.3D_matrices/nb_matrix.npy')
-            matrix_sr = np.load('.3D_matrices/sr_matrix.npy')
-
-        #polygon ROI - floor
-        mask_floor = np.zeros((1520, 2688), dtype=np.uint8) #max val is 255
-        cv2.fillPoly(mask_floor, [vertices_floor], 255)
-        #polygon ROI - nesting boxes
-        mask_nb = np.zeros((1520, 2688), dtype=np.uint8) #max val is 255
-        cv2.fillPoly(mask_nb, [vertices_nb], 255)
-        #polygon ROI - single roost
-        mask_sr = np.zeros((1520, 2688), dtype=np.uint8) #max val is 255
-        cv2.fillPoly(mask_sr, [vertices_sr], 255)
-        #polygon ROI - double roost
-        mask_dr = np.zeros((1520, 2688), dtype=np.uint8) #max val is 255
-        cv2.fillPoly(mask_dr, [vertices_dr], 255)
-
-        # rear double roost now takes priority over floor
-        if mask_dr[y, x] == 255: #double roost
-            dr_bb_x = dr_bb_x_max - dr_bb_x_min
-            dr_bb_y = dr_bb_y_max - dr_bb_y_min
-
-            #scaling factor
-            x_scale = 1 / dr_bb_x
-            y_scale = 6.5 / dr_bb_y
+            table = self._scan_av(av, reader, anchor_interval)
 
-            #normalization
-            #matrix_dr = np.load('.3D_matrices/dr_matrix.npy')
-            pixel_coord = np.array([x, y, 1])
-            trans_pixel = matrix_dr.dot(pixel_coord)
-            trans_pixel /= trans_pixel[2]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, **vars(table))
+        os.replace(tmp_path, self.path)
+        self.table = table
+        print(f"Indexed video in {time.perf_counter() - start:.1f} s "
+              f"({len(table.keyframes)} keyframes, "
+              f"{len(table.anchor_frames)} timestamp anchors)")
 
-            #scaling
-            real_x = trans_pixel[0] * x_scale + nesting_boxes + 2
-            real_y = trans_pixel[1] * y_scale
-            est_z = 0.6
+    def build_in_background(self, ocr_backend: str) -> bool:
+        """Starts build() on a thread, unless the index is built or building.
 
-        elif mask_floor[y, x] == 255: #floor
-            floor_bb_x = floor_bb_x_max - floor_bb_x_min
-            floor_bb_y = floor_bb_y_max - floor_bb_y_min
+        The scan gets its own TimestampReader, so it doesn't hold the lock
+        or evict the cache of the one reading clicks.
 
-            #scaling factor
-            x_scale = x_meas / floor_bb_x
-            y_scale = y_meas / floor_bb_y
+        Args:
+            ocr_backend: ocr_backend option, for make_ocr_engine()
 
-            #normalization
-            #matrix_floor = np.load('.3D_matrices/floor_matrix.npy')
-            pixel_coord = np.array([x, y, 1])
-            trans_pixel = matrix_floor.dot(pixel_coord)
-            trans_pixel /= trans_pixel[2]
+        Returns:
+            started: True if a scan was started
+        """
 
-            #scaling
-            real_x = trans_pixel[0] * x_scale + nesting_boxes
-            real_y = trans_pixel[1] * y_scale
-            est_z = 0.2 #a chicken is a solid 40 cm tall, so halve that?
+        if self.table is not None or self._builder is not None:
+            return False
+        reader = TimestampReader(make_ocr_engine(ocr_backend))
+        self._builder = threading.Thread(target=self.build, args=(reader,),
+                                         name='seek-index', daemon=True)
+        self._builder.start()
+        return True
 
-        elif mask_nb[y, x] == 255: #nesting boxes
-            nb_bb_x = nb_bb_x_max - nb_bb_x_min
-            nb_bb_y = nb_bb_y_max - nb_bb_y_min
+    @staticmethod
+    def _anchor(reader: TimestampReader,
+                image: np.ndarray) -> np.datetime64 | None:
+        try:
+            return np.datetime64(datetime.datetime.strptime(
+                ' '.join(reader.read(image)), TIMESTAMP_FORMAT), 's')
+        except (ValueError, RuntimeError):
+            return None #unreadable timestamp; try the next one
+
+    def _scan_av(self, av, reader: TimestampReader,
+                 anchor_interval: float) -> types.SimpleNamespace:
+        keyframes = []
+        anchor_frames, anchor_times = [], []
+        with av.open(self.video) as container:
+            stream = container.streams.video[0]
+            stream.codec_context.skip_frame = 'NONKEY' #decode keyframes only
+            fps = float(stream.guessed_rate or stream.average_rate or 25)
+            # Frame numbers from pts, the same way OpenCV's FFmpeg backend does
+            origin = stream.start_time or 0
+            def to_index(pts: int) -> int:
+                return round(float((pts - origin) * stream.time_base) * fps)
+
+            frame_count = 0
+            next_anchor = 0.0
+            for packet in container.demux(stream):
+                if packet.pts is None: continue #flush packet
+                frame_count = max(frame_count, to_index(packet.pts) + 1)
+                if packet.is_keyframe:
+                    keyframes.append(to_index(packet.pts))
+                for frame in packet.decode():
+                    frame_index = to_index(frame.pts)
+                    if frame_index < next_anchor: continue
+                    image = frame.to_ndarray(format='bgr24')
+                    when = self._anchor(reader, image)
+                    if when is not None:
+                        anchor_frames.append(frame_index)
+                        anchor_times.append(when)
+                        next_anchor = frame_index + anchor_interval * fps
+
+        return types.SimpleNamespace(
+            fps=np.float64(fps), frame_count=np.int64(frame_count),
+            keyframes=np.array(keyframes, np.int64),
+            anchor_frames=np.array(anchor_frames, np.int64),
+            anchor_times=np.array(anchor_times, 'datetime64[s]'))
+
+    def _scan_cv2(self, reader: TimestampReader,
+                  anchor_interval: float) -> types.SimpleNamespace:
+        anchor_frames, anchor_times = [], []
+        cap = cv2.VideoCapture(self.video)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25
+        frame_index = 0
+        next_anchor = 0.0
+        while cap.grab():
+            if frame_index >= next_anchor:
+                ret, image = cap.retrieve()
+                when = self._anchor(reader, image) if ret else None
+                if when is not None:
+                    anchor_frames.append(frame_index)
+                    anchor_times.append(when)
+                    next_anchor = frame_index + anchor_interval * fps
+            frame_index += 1
+        cap.release()
+
+        return types.SimpleNamespace(
+            fps=np.float64(fps), frame_count=np.int64(frame_index),
+            keyframes=np.empty(0, np.int64),
+            anchor_frames=np.array(anchor_frames, np.int64),
+            anchor_times=np.array(anchor_times, 'datetime64[s]'))
+
+    def keyframe_before(self, frame_index: int) -> int:
+        """Index of last keyframe at or before frame_index, -1 if unknown."""
+
+        table = self.table
+        if table is None:
+            return -1
+        pos = int(np.searchsorted(table.keyframes, frame_index, 'right'))
+        return int(table.keyframes[pos - 1]) if pos else -1
+
+    def estimate_frame(self, when: datetime.datetime) -> int | None:
+        """Estimates a frame showing a DVR time from the anchors, no decoding.
+
+        The anchor's time was floored by the clock, so the estimate is a
+        frame within the second of when, up to one second after its tick.
 
-            #scaling factor
-            x_scale = nesting_boxes / nb_bb_x
-            y_scale = y_meas / nb_bb_y
+        Args:
+            when: DVR date/time to find
 
-            #normalization
-            #matrix_nb = np.load('.3D_matrices/nb_matrix.npy')
-            pixel_coord = np.array([x, y, 1])
-            trans_pixel = matrix_nb.dot(pixel_coord)
-            trans_pixel /= trans_pixel[2]
+        Returns:
+            frame_index: index of frame, or None if when isn't in the video
+        """
 
-            #scaling
-            real_x = trans_pixel[0] * x_scale
-            real_y = trans_pixel[1] * y_scale
-            est_z = 0.2 #a chicken is a solid 40 cm tall, so halve that?
+        table = self.table
+        if table is None or not len(table.anchor_frames):
+            return None
+        target = np.datetime64(when, 's')
+        pos = int(np.searchsorted(table.anchor_times, target, 'right'))
+        if not pos:
+            return None
+        anchor_frame = table.anchor_frames[pos - 1]
+        seconds = ((target - table.anchor_times[pos - 1]) /
+                   np.timedelta64(1, 's'))
+        estimate = int(anchor_frame + round(seconds * table.fps))
+        if pos < len(table.anchor_frames):
+            estimate = min(estimate, int(table.anchor_frames[pos]))
+        if estimate - table.fps >= table.frame_count:
+            return None
+        return min(estimate, int(table.frame_count) - 1)
+
+    def find_time(self, cap: TVideoCapture,
+                  when: datetime.datetime) -> int | None:
+        """Finds first frame showing a DVR time, and seeks cap to it.
+
+        estimate_frame() is at most one second late, so the second before
+        it is read for the clock tick.
 
-        elif mask_sr[y, x] == 255: #single roost
-            sr_bb_x = sr_bb_x_max - sr_bb_x_min
-            sr_bb_y = sr_bb_y_max - sr_bb_y_min
+        Args:
+            cap: capture of the indexed video
+            when: DVR date/time to find
 
-            #scaling factor
-            x_scale = 1 / sr_bb_x
-            y_scale = 3.54 / sr_bb_y
+        Returns:
+            frame_index: index of frame, or None if when isn't in the video
+        """
 
-            #normalization
-            #matrix_sr = np.load('.3D_matrices/sr_matrix.npy')
-            pixel_coord = np.array([x, y, 1])
-            trans_pixel = matrix_sr.dot(pixel_coord)
-            trans_pixel /= trans_pixel[2]
+        table = self.table
+        estimate = self.estimate_frame(when)
+        if table is None or estimate is None:
+            return None
+
+        start = max(0, estimate - round(float(table.fps)))
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        last = None
+        for frame_index in range(start, estimate + 1):
+            ret, frame = cap.read()
+            if not ret: break
+            thresh = threshold_timestamp(frame)
+            if last is not None and not np.array_equal(thresh, last):
+                estimate = frame_index #clock ticked over to when
+                break
+            last = thresh
+
+        cap.set(cv2.CAP_PROP_POS_FRAMES, estimate)
+        return estimate
+
+
+def make_record(timestamp_date: str, timestamp_time: str, frame_index: int,
+                x: int, y: int, coord_3d: tuple[float, float, float],
+                adjusted_3d: tuple[float, float, float], region: int,
+                adjusted_region: int) -> dict[str, Any]:
+    """Builds a typed record of a click for the .npz columns.
 
-            #scaling
-            real_x = trans_pixel[0] * x_scale + nesting_boxes + 2
-            real_y = trans_pixel[1] * y_scale + 7
-            est_z = 0.4
+    Args:
+        timestamp_date: date from timestamp, DD/MM/YYYY
+        timestamp_time: time from timestamp, HH:MM:SS
+        frame_index: index of clicked frame in video
+        x: x-coordinate of click
+        y: y-coordinate of click
+        coord_3d: 3D coordinate, NaN if not mapped
+        adjusted_3d: 3D coordinate with adjusted quads, NaN if not mapped
+        region: region of coord_3d
+        adjusted_region: region of adjusted_3d
+
+    Returns:
+        record: values keyed by RECORD_COLUMNS, JSON serializable; the
+            coordinates of an OUTSIDE region are NaN, not -1
+    """
+
+    try:
+        timestamp = datetime.datetime.strptime(
+            f"{timestamp_date} {timestamp_time}", TIMESTAMP_FORMAT).isoformat()
+    except ValueError:
+        timestamp = 'NaT' #OCR misread; keep the row anyway
+    # -1 would pass for a position when averaged; spreadsheet shows ( )
+    nan_3d = (float('nan'),) * 3
+    if region == CoordinateManager.OUTSIDE:
+        coord_3d = nan_3d
+    if adjusted_region == CoordinateManager.OUTSIDE:
+        adjusted_3d = nan_3d
+
+    return dict(zip(RECORD_COLUMNS, (
+        timestamp, frame_index, x, y, *coord_3d, *adjusted_3d,
+        region, adjusted_region)))
+
+
+def make_row(coord: CoordinateManager, timestamp_date: str,
+             timestamp_time: str, x: int, y: int,
+             coord_3d: tuple[float, float, float],
+             adjusted_3d: tuple[float, float, float]) -> list[str]:
+    """Formats a click as a spreadsheet row, matching make_headers().
+
+    Args:
+        coord: coordinate manager the click was mapped with
+        timestamp_date: date from timestamp, DD/MM/YYYY
+        timestamp_time: time from timestamp, HH:MM:SS
+        x: x-coordinate of click
+        y: y-coordinate of click
+        coord_3d: 3D coordinate, from CoordinateManager.get_3d()
+        adjusted_3d: 3D coordinate with adjusted quads
+
+    Returns:
+        data: row of formatted strings
+    """
+
+    if coord.three_d == 'Floor':
+        new_x, new_y, new_z = coord_3d
+        if coord.quads is not False:
+            adj_x, adj_y, adj_z = adjusted_3d
+            if coord_3d[0] == -1:
+                return [timestamp_date, timestamp_time, f"({x}, {y})", '( )']
+            return [timestamp_date, timestamp_time, f"({x}, {y})",
+                    f"({new_x:.2f}, {new_y:.2f}, {new_z:.2f})",
+                    f"({adj_x:.2f}, {adj_y:.2f}, {adj_z:.2f})"]
+        return [timestamp_date, timestamp_time, f"({x}, {y})",
+                f"({new_x:.2f}, {new_y:.2f}, {new_z:.2f})"]
+    return [timestamp_date, timestamp_time, f"({x}, {y})"]
+
+
+def make_headers(coord: CoordinateManager) -> list[str]:
+    """Spreadsheet column headers for the coordinate manager's 3D mode.
+
+    Args:
+        coord: coordinate manager clicks are mapped with
+
+    Returns:
+        headers: column headers
+    """
+
+    headers = ['Date', 'Time', 'Coordinates']
+    if coord.three_d == 'Floor':
+        headers.append('3D Coordinates')
+        if coord.quads is not False:
+            headers.append('Adjusted 3D')
+    return headers
 
-        else: #outside of predefined boxes -> probably a wall or something
-            real_x = -1.0
-            real_y = -1.0
-            est_z = -1.0
 
-        return real_x, real_y, est_z
+class ClickPipeline():
+    """Timestamps, maps and saves clicks on a worker thread, in click order.
+
+    The mouse callback only queues (click id, frame index, x, y, wall time)
+    and a copy of the frame's timestamp corner. One worker handles events
+    first-in, first-out, so rows are saved in click order. A clear queued
+    behind in-flight clicks removes the row of the click it names, and is
+    skipped if that click never made it into the sheet. Undo and redo are
+    queued the same way, so they apply after clicks still in flight.
+    """
+
+    def __init__(self, coord: CoordinateManager, sheet: SpreadSheet,
+                 timestamps) -> None:
+        self.coord = coord
+        self.sheet = sheet
+        self.timestamps = timestamps
+        self.next_id = 0
+        self._queue = queue.Queue() # type: queue.Queue[tuple | None]
+        self._thread = threading.Thread(target=self._work,
+                                        name='click-pipeline', daemon=True)
+        self._thread.start()
+
+    def submit_click(self, x: int, y: int, frame, frame_index: int) -> int:
+        """Queues a left-click; called from the mouse callback.
+
+        Args:
+            x: x-coordinate of click
+            y: y-coordinate of click
+            frame: video frame that was clicked
+            frame_index: index of frame in video
+
+        Returns:
+            click_id: id to pass to submit_clear()
+        """
+
+        click_id = self.next_id
+        self.next_id += 1
+        # Timestamp corner is all OCR needs; frame itself may be drawn on
+        corner = frame[:100, :634].copy()
+        self._queue.put(('click', click_id, frame_index, x, y, time.time(),
+                         corner))
+
+        return click_id
+
+    def submit_clear(self, click_id: int) -> None:
+        """Queues removal of a click's row, after any clicks still in flight.
+
+        Args:
+            click_id: id from submit_click()
+        """
+
+        self._queue.put(('clear', click_id))
+
+    def submit_undo(self) -> None:
+        """Queues undo of the latest row, after any clicks still in flight."""
+
+        self._queue.put(('undo',))
+
+    def submit_redo(self) -> None:
+        """Queues redo of the latest undone row."""
+
+        self._queue.put(('redo',))
+
+    def _work(self) -> None:
+        while True:
+            try:
+                event = self._queue.get(timeout=self.sheet.flush_interval)
+            except queue.Empty:
+                self.sheet.flush() #idle: write out edits still in memory
+                continue
+            if event is None: break
+            try:
+                if event[0] == 'click':
+                    self._process_click(*event[1:])
+                elif event[0] == 'clear':
+                    if self.sheet.last_id() == event[1]:
+                        self.sheet.undo()
+                elif event[0] == 'undo':
+                    row = self.sheet.undo()
+                    print(f"Undo: {row}\n" if row else 'Nothing to undo\n')
+                elif event[0] == 'redo':
+                    row = self.sheet.redo()
+                    print(f"Redo: {row}\n" if row else 'Nothing to redo\n')
+            except Exception as e:
+                logging.getLogger(__name__).error('\nError: %s\n', e,
+                                                  exc_info=True)
+                print(f'***Could not save click: {e}***')
+
+    def _process_click(self, click_id: int, frame_index: int, x: int, y: int,
+                       wall_time: float, corner) -> None:
+        try:
+            timestamp_date, timestamp_time = self.timestamps.read(
+                corner, frame_index)
+        except (ValueError, RuntimeError) as e:
+            print(f"***Could not read timestamp ({e}); saving click "
+                  "without it***")
+            timestamp_date, timestamp_time = '', '' #misread clock
+        (coord_3d, adjusted_3d, region,
+         adjusted_region) = self.coord.get_3d(x, y)
+        nan_3d = (float('nan'),) * 3
+        record = make_record(
+            timestamp_date, timestamp_time, frame_index, x, y,
+            coord_3d if self.coord.three_d == 'Floor' else nan_3d,
+            adjusted_3d if self.coord.quads != False else nan_3d,
+            region, adjusted_region)
+
+        data = make_row(self.coord, timestamp_date, timestamp_time, x, y,
+                        coord_3d, adjusted_3d)
+        self.sheet.append_to_spreadsheet(data, click_id, record)
+
+        # Print timestamp and coordinates in case .xlsx gets corrupted
+        print(timestamp_date)
+        print(timestamp_time)
+        print(f"{str((x, y))}\n")
+
+    def close(self) -> None:
+        """Finishes all queued events, then stops the worker."""
+
+        self._queue.put(None)
+        self._thread.join()
 
 
 def mouse_input(
     event: int, x: int, y: int, flags: int,
-    param: tuple[CoordinateManager, AnnotationManager, SpreadSheet])-> None:
+    param: tuple[CoordinateManager, AnnotationManager, ClickPipeline,
+                 TimestampReader | TimestampPrefetcher | TimestampExtrapolator,
+                 Display]
+    )-> None:
     """Mouse input callback function for cv2.
 
     Args:
@@ -379,48 +2701,31 @@ def mouse_input(
     """
 
     del flags # Unused.
-    coord, anno, sheet = param #unpack objects
+    coord, anno, pipeline, timestamps, display = param #unpack objects
+    x, y = display.to_source(x, y) #window pixels to video pixels
 
-    if not anno.typing: #if user isn't typing annotation
+    # Clicks go with the frame on screen, not the one decoded after it
+    if not anno.typing and anno.shown_frame is not None:
         if event == cv2.EVENT_LBUTTONDOWN: #left mouse click
-            coord.start_time = time.time()
-            coord.set_coord(x, y)
-            timestamp_date, timestamp_time = get_timestamp(anno.frame)
-
-            # Format data
-            if coord.three_d == 'Floor':
-                new_x, new_y, new_z = coord.coord_3d
-                if coord.quads != False:
-                    adj_x, adj_y, adj_z = coord.adjusted_3d
-                    if coord.coord_3d[0] == -1:
-                        data = [timestamp_date,timestamp_time, f"({x}, {y})", '( )']
-                    else:
-                        data = [timestamp_date, timestamp_time, f"({x}, {y})",
-                            f"({new_x:.2f}, {new_y:.2f}, {new_z:.2f})",
-                            f"({adj_x:.2f}, {adj_y:.2f}, {adj_z:.2f})"]
-                else:    
-                    data = [timestamp_date, timestamp_time, f"({x}, {y})",
-                            f"({new_x:.2f}, {new_y:.2f}, {new_z:.2f})"]
-            else:
-                data = [timestamp_date, timestamp_time, f"({x}, {y})"]
-            sheet.append_to_spreadsheet(data)
-
-            # Print timestamp and coordinates in case .xlsx gets corrupted
-            print(timestamp_date)
-            print(timestamp_time)
-            print(f"{str(coord.coord)}\n")
+            # Only record the click here; pipeline does the slow work
+            click_id = pipeline.submit_click(x, y, anno.shown_frame,
+                                             anno.shown_index)
+            coord.set_coord(x, y, click_id)
 
         elif event == cv2.EVENT_RBUTTONDOWN: #right mouse click
-            _, timestamp_time = get_timestamp(anno.frame)
+            _, timestamp_time = timestamps.read(anno.shown_frame,
+                                                anno.shown_index)
             anno.start_typing(x, y, timestamp_time)
 
 
-def get_timestamp(frame) -> tuple[str, str]:
-    """Gets burnt-in timestamp via OCR (not video timestamp from OpenCV).
+def threshold_timestamp(frame) -> np.ndarray:
+    """Crops and thresholds the burnt-in timestamp for OCR.
+
+    Args:
+        frame: video frame
 
     Returns:
-        timestamp_date: date from timestamp, DD/MM/YYYY
-        timestamp_time: time from timestamp, HH:MM:SS
+        timestamp_thresh: binary image of timestamp area
     """
 
     ts_area = frame[30:100, 26:634] #bounding box, [y:y+h, x:x+w]
@@ -428,8 +2733,24 @@ def get_timestamp(frame) -> tuple[str, str]:
     #binary threshold for better recognition
     _, timestamp_thresh = cv2.threshold(ts_gray, 187, 255, cv2.THRESH_BINARY)
     #cv2.imshow('thresh', timestamp_thresh)
+
+    return timestamp_thresh
+
+
+def ocr_timestamp(timestamp_thresh, engine) -> tuple[str, str]:
+    """Gets burnt-in timestamp via OCR (not video timestamp from OpenCV).
+
+    Args:
+        timestamp_thresh: binary image of timestamp area
+        engine: OCR engine from make_ocr_engine()
+
+    Returns:
+        timestamp_date: date from timestamp, DD/MM/YYYY
+        timestamp_time: time from timestamp, HH:MM:SS
+    """
+
     #convert text in image to string
-    timestamp = pytesseract.image_to_string(timestamp_thresh, config='--psm 7')
+    timestamp = engine.image_to_string(timestamp_thresh)
     #remove space, split after date
     timestamp_date, timestamp_time = timestamp.strip().split(' ')
 
@@ -455,6 +2776,23 @@ def arg_parsing() -> argparse.Namespace:
         help='Opens the GUI for setting program options.')
     parser.add_argument('--version', action='version',
         version=f"%(prog)s {__version__}", help=argparse.SUPPRESS)
+    subparsers = parser.add_subparsers(dest='command')
+    batch = subparsers.add_parser('batch', help=('Maps a .csv of clicks to '
+        'a spreadsheet without opening the video.'))
+    batch.add_argument('clicks', help=('.csv of frame index or '
+        '[DD/MM/YYYY ]HH:MM:SS, x, y rows, or a spreadsheet .csv.'))
+    batch.add_argument('--video',
+        help='Video clicked on (default: video_path).')
+    batch.add_argument('--name', help=('Output file name, without extension '
+        '(default: date and time).'))
+    calibrate = subparsers.add_parser('calibrate', help=('Learns timestamp '
+        'templates (ocr_backend "template") from one frame.'))
+    calibrate.add_argument('--video',
+        help='Video to calibrate on (default: video_path).')
+    calibrate.add_argument('--frame', type=int, default=0,
+        help='Index of a frame with a clear timestamp (default: 0).')
+    calibrate.add_argument('--text', help=('Timestamp shown on the frame, '
+        'DD/MM/YYYY HH:MM:SS (default: confirm the OCR read).'))
 
     return parser.parse_args()
 
@@ -500,6 +2838,22 @@ def get_system_info() -> str:
     return info
 
 
+def peak_memory_mb() -> float | None:
+    """Gets peak resident memory (RSS) of this process, where available.
+
+    Returns:
+        peak: peak RSS in MB, or None on Windows
+    """
+
+    try:
+        import resource
+    except ImportError: #Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 1e6 if platform.system() == 'Darwin' else peak * 1024 / 1e6
+
+
 def set_up_logger() -> logging.Logger:
     """Sets up error logger with custom terminator to separate error entries.
 
@@ -547,6 +2901,62 @@ def get_window_and_video_dims(cap: TVideoCapture) -> tuple[int, int, int, int]:
     return window_width, window_height, video_width, video_height
 
 
+def prompt_text(window_name: str, display: Display, frame, frame_index: int,
+                prompt: str, font: types.SimpleNamespace) -> str | None:
+    """Shows a one-line prompt over frame and reads typed digits/time.
+
+    Args:
+        window_name: name of video window
+        display: renders frame at window size
+        frame: video frame to show prompt over
+        frame_index: index of frame in video
+        prompt: text before what's typed
+        font: font settings for putText
+
+    Returns:
+        text: typed text when Enter is pressed, None if Esc is pressed
+    """
+
+    text = ''
+    while True:
+        canvas = display.render(frame, frame_index)
+        display.put_text(canvas, prompt + text, (30, 170), font)
+        cv2.imshow(window_name, canvas)
+        display.clear(canvas) #makes backspace work
+
+        key_press = cv2.waitKey(0) & 0xFF #LSByte for cross-plat compat
+        if key_press == 13: #Enter
+            return text
+        elif key_press == 27: #Esc
+            return None
+        elif key_press == 8 or key_press == 127: #Backspace/Del
+            text = text[:-1]
+        elif chr(key_press) in '0123456789/: ':
+            text += chr(key_press)
+
+
+def parse_goto(text: str, current_date: str) -> int | datetime.datetime | None:
+    """Parses a go-to prompt as a frame index or a DVR date/time.
+
+    Args:
+        text: frame index, HH:MM:SS, or DD/MM/YYYY HH:MM:SS
+        current_date: DD/MM/YYYY date used when text is only a time
+
+    Returns:
+        target: frame index, date/time, or None if text is neither
+    """
+
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    if ' ' not in text:
+        text = f"{current_date} {text}"
+    try:
+        return datetime.datetime.strptime(text, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
 def key_ascii(key: str) -> int:
     """Get ASCII value of key (options_gui only allows printable chars + Esc).
 
@@ -554,13 +2964,224 @@ def key_ascii(key: str) -> int:
         key: key to get ASCII value of
 
     Returns:
-        ASCII value of key
+        ASCII value of key, -1 (never pressed) if key is turned off ('')
     """
 
+    if not key: return -1
     if key.lower() == 'esc': return 27
     return ord(key)
 
 
+def read_clicks(path: str) -> list[tuple[str, int, int]]:
+    """Reads clicks to be batch mapped.
+
+    Rows are frame index or [DD/MM/YYYY ]HH:MM:SS, x, y; a header row is
+    skipped. A .csv written by SpreadSheet works too, so old sessions can
+    be remapped after a calibration change.
+
+    Args:
+        path: path of .csv file
+
+    Returns:
+        clicks: (frame index or time, as text, x, y) of each click
+    """
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    spreadsheet = bool(rows) and rows[0][:3] == ['Date', 'Time', 'Coordinates']
+    clicks = []
+    for row in rows[1:] if spreadsheet else rows:
+        try:
+            if spreadsheet:
+                x, y = row[2].strip('()').split(',')
+                clicks.append((f"{row[0]} {row[1]}", int(x), int(y)))
+            else:
+                clicks.append((row[0].strip(), int(float(row[1])),
+                               int(float(row[2]))))
+        except (ValueError, IndexError):
+            continue #header or blank row
+
+    return clicks
+
+
+def batch_map(clicks_file: str, video: str,
+              prog_options: types.SimpleNamespace, coord: CoordinateManager,
+              name: str) -> str:
+    """Maps a file of clicks to a spreadsheet, with no window or key polling.
+
+    Clicked frames are visited in order, so the video is read front to
+    back once: gaps are grabbed through without decoding to BGR, unless
+    the SeekIndex has a keyframe in them to jump to. Only clicked
+    frames are read for their timestamp, through TimestampReader's cache;
+    clicks given as DVR times need no decoding at all. Every click is
+    then mapped to 3D in one vectorized pass.
+
+    Args:
+        clicks_file: .csv of clicks, see read_clicks()
+        video: path of video clicked on
+        prog_options: program options
+        coord: coordinate manager to map clicks with
+        name: name of output files, without extension
+
+    Returns:
+        path: path of written .xlsx
+    """
+
+    start = time.perf_counter()
+    clicks = read_clicks(clicks_file)
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Can't open video {video!r}")
+    coord.set_frame_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    # Without keyframes from the index, grab through gaps under 10 s
+    max_gap = int(10 * (cap.get(cv2.CAP_PROP_FPS) or 25))
+    reader = TimestampReader(make_ocr_engine(prog_options.ocr_backend))
+    def read_timestamp(frame) -> tuple[str, str]:
+        try:
+            return reader.read(frame)
+        except (ValueError, RuntimeError):
+            return '', '' #misread clock; keep its clicks anyway
+
+    # Without PyAV, indexing decodes the whole video and finds no keyframes,
+    # so it is only worth it to place clicks given as times
+    index = None
+    if prog_options.seek_index:
+        index = SeekIndex(video)
+        has_times = any(not text.isdigit() for text, _, _ in clicks)
+        if index.table is None and (has_times or
+                                    SeekIndex.keyframes_available()):
+            print('Indexing video for seeking...')
+            index.build(reader)
+        if index.table is None:
+            index = None
+    has_keyframes = (index is not None and index.table is not None and
+                     len(index.table.keyframes) > 0)
+
+    # Rows with only a time are on the date the video starts on
+    position = 0 #index of frame the next cap.read() returns
+    current_date = ''
+    if any(' ' not in text and not text.isdigit() for text, _, _ in clicks):
+        ret, frame = cap.read()
+        if ret:
+            current_date = read_timestamp(frame)[0]
+            position = 1
+    targets = [parse_goto(text, current_date) for text, _, _ in clicks]
+
+    timestamps = {} # type: dict[int, tuple[str, str]]
+    for frame_index in sorted({t for t in targets if isinstance(t, int)}):
+        gap = frame_index - position
+        if index is not None and has_keyframes:
+            jump = index.keyframe_before(frame_index) > position
+        else:
+            jump = gap > max_gap
+        if jump: #decodes on from the keyframe before frame_index
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        else:
+            for _ in range(gap):
+                if not cap.grab(): break
+        ret, frame = cap.read()
+        position = frame_index + 1
+        timestamps[frame_index] = read_timestamp(frame) if ret else ('', '')
+    cap.release()
+
+    kept, dates_times, frame_indices = [], [], []
+    for (text, x, y), target in zip(clicks, targets):
+        if isinstance(target, datetime.datetime):
+            estimate = None if index is None else index.estimate_frame(target)
+            dates_times.append((target.strftime('%d/%m/%Y'),
+                                target.strftime('%H:%M:%S')))
+            frame_indices.append(-1 if estimate is None else estimate)
+        elif isinstance(target, int):
+            dates_times.append(timestamps.get(target, ('', '')))
+            frame_indices.append(target)
+        else:
+            print(f"Skipping click at {text!r}, not a frame or time")
+            continue
+        kept.append((x, y))
+
+    # Map everything at once; -1/OUTSIDE like get_3d() when not mapped
+    points = np.array(kept, np.int64).reshape(-1, 2)
+    world = adjusted = np.full((len(points), 3), -1.0)
+    regions = adjusted_regions = np.full(len(points), coord.OUTSIDE)
+    if len(points) and coord.three_d == 'Floor':
+        world, regions = coord.map_points(points)
+    if len(points) and coord.quads is not False:
+        adjusted, adjusted_regions = coord.map_points(points, adjusted=True)
+
+    nan_3d = (float('nan'),) * 3
+    data = [] # type: list[list[str]]
+    records = [] # type: list[dict[str, Any] | None]
+    for i, (x, y) in enumerate(points.tolist()):
+        timestamp_date, timestamp_time = dates_times[i]
+        coord_3d = tuple(world[i].tolist())
+        adjusted_3d = tuple(adjusted[i].tolist())
+        data.append(make_row(coord, timestamp_date, timestamp_time, x, y,
+                             coord_3d, adjusted_3d))
+        records.append(make_record(
+            timestamp_date, timestamp_time, frame_indices[i], x, y,
+            coord_3d if coord.three_d == 'Floor' else nan_3d,
+            adjusted_3d if coord.quads is not False else nan_3d,
+            int(regions[i]), int(adjusted_regions[i])))
+
+    store = None
+    if prog_options.sqlite_db:
+        store = SessionStore(prog_options.sqlite_db)
+    sheet = SpreadSheet(prog_options.out_dir, name, make_headers(coord),
+                        journaled=False, store=store, video=video)
+    sheet.extend_spreadsheet(data, records)
+    sheet.close()
+    if store is not None:
+        store.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Mapped {len(data)} clicks in {elapsed:.2f} s "
+          f"({len(data) / max(elapsed, 1e-9):.0f}/s, "
+          f"{len(timestamps)} frames read) into {sheet}")
+    return str(sheet)
+
+
+def calibrate_templates(video: str, frame_index: int,
+                        text: str | None = None) -> int:
+    """Learns the template engine's glyphs from one frame of the video.
+
+    Tesseract's read of the frame is shown for the user to confirm or
+    correct at the terminal, unless text is given.
+
+    Args:
+        video: path of video to calibrate on
+        frame_index: index of a frame whose timestamp is clear
+        text: timestamp shown on the frame, DD/MM/YYYY HH:MM:SS
+
+    Returns:
+        learned: number of characters learned
+    """
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Can't open video {video!r}")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        raise ValueError(f"Can't read frame {frame_index} of {video!r}")
+
+    image = threshold_timestamp(frame)
+    engine = TemplateEngine(make_ocr_engine('auto'))
+    if text is None:
+        text = engine.fallback.image_to_string(image).strip()
+        answer = input(f"Frame {frame_index} reads {text!r}; press Enter if "
+                       "that's right, or type the timestamp shown: ")
+        text = answer.strip() or text
+    learned = engine.calibrate(image, text)
+    if learned:
+        print(f"Learned {learned} characters into {engine.templates_file}")
+    else:
+        print(f"Couldn't learn from {text!r}; try --text or another --frame")
+
+    return learned
+
+
 def main():
     args = arg_parsing()
     if args.options:
@@ -576,127 +3197,275 @@ def main():
         pytesseract.pytesseract.tesseract_cmd = R'C:\Program Files\Tesseract-OCR\tesseract.exe'
     
     options_file = '.options.json'
-    prog_options = types.SimpleNamespace(**get_args_from_file(options_file))
+    saved_options = get_args_from_file(options_file)
+    prog_options = types.SimpleNamespace(**{**OPTION_DEFAULTS,
+                                            **saved_options})
     quads_file = '.quads.json'
-    quads = get_args_from_file(quads_file)['quads']
-    default_quads = [
-        [[1184, 104], [1394, 123], [2475, 1520], [1030, 1520]],
-        [[1049, 125], [0, 1520], [1030, 1520], [1185, 200]],
-        [[1597, 496], [1820, 448], [2469, 1158], [2015, 1337]],
-        [[1250, 55], [1443, 32], [1830, 365], [1511, 448]]
-    ]
-
-    if quads == default_quads:
+    quads_dict = get_args_from_file(quads_file)
+    quads = quads_dict['quads']
+    quads_size = tuple(quads_dict.get('frame_size', CALIBRATION_SIZE))
+
+    if quads == DEFAULT_QUADS:
         quads = False
 
+    # Keys added since an options file was saved may clash with its keys;
+    # turn those off rather than refuse to start
+    key_names = collections.defaultdict(list)
+    for name, key in vars(prog_options).items():
+        if name.endswith('_key') and key:
+            key_names[key_ascii(key)].append(name)
+    clashes = []
+    for names in key_names.values():
+        saved = [name for name in names if name in saved_options]
+        if saved and len(saved) < len(names):
+            for name in names:
+                if name not in saved:
+                    print(f"{name} is the same key as {saved[0]}; turned off "
+                          f"until {saved[0]} is changed (chicken_map.py -o)")
+                    setattr(prog_options, name, '')
+        if len(saved) > 1:
+            clashes.append(' and '.join(saved))
+    if clashes: #options_gui can't see every key, so check them all here
+        raise SystemExit(f"Same key set for {'; '.join(clashes)} in "
+                         f"{options_file}; please change one of them")
+
     # Set up arguments for program use
     infile_path = prog_options.video_path.strip() #strip whitespace for MacOS
     exit_key = key_ascii(prog_options.exit_key)
     clear_key = key_ascii(prog_options.clear_key)
     pause_key = key_ascii(prog_options.pause_key)
     screencap_key = key_ascii(prog_options.screencap_key)
+    undo_key = key_ascii(prog_options.undo_key)
+    redo_key = key_ascii(prog_options.redo_key)
+    goto_key = key_ascii(prog_options.goto_key)
+    step_back_key = key_ascii(prog_options.step_back_key)
+    step_forward_key = key_ascii(prog_options.step_forward_key)
+    rewind_key = key_ascii(prog_options.rewind_key)
+    slower_key = key_ascii(prog_options.slower_key)
+    faster_key = key_ascii(prog_options.faster_key)
     duration = prog_options.duration #duration on screen, in seconds
     font = types.SimpleNamespace(font=prog_options.font,
                                  scale=prog_options.font_scale,
                                  color=tuple(reversed(prog_options.font_color)),
                                  thickness=prog_options.font_thickness)
 
+    if args.command == 'calibrate': #headless, and needs no 3D matrices
+        video = infile_path
+        if args.video:
+            video = os.path.join(LAUNCH_DIR, args.video)
+        calibrate_templates(video, args.frame, args.text)
+        return
+
     # Instantiate classes and set up headers
-    coord = CoordinateManager(prog_options.three_d, quads)
-    headers = ['Date', 'Time', 'Coordinates']
-    if coord.three_d == 'Floor':
-        headers.append('3D Coordinates')
-        if quads != False: 
-            headers.append('Adjusted 3D')
+    coord = CoordinateManager(prog_options.three_d, quads, quads_size)
+    print(f"3D matrices loaded in {coord.matrices.load_time * 1000:.1f} ms")
+    headers = make_headers(coord)
+    if args.command == 'batch': #headless; no windows, writers, or Tk
+        video = infile_path
+        if args.video:
+            video = os.path.join(LAUNCH_DIR, args.video)
+        batch_map(os.path.join(LAUNCH_DIR, args.clicks), video, prog_options,
+                  coord, args.name or f"{system_date_time}_batch")
+        return
+    writer = ImageWriter(prog_options.image_format, prog_options.jpeg_quality,
+                         prog_options.png_compression,
+                         prog_options.webp_quality)
     anno = AnnotationManager(f"{prog_options.anno_dir}/{system_date_time}")
+    anno.writer = writer
     screencap = ScreenCapture(
         f"{prog_options.screencaps_dir}/{system_date_time}")
-    sheet = SpreadSheet(prog_options.out_dir, system_date_time, headers)
-
-    # Determine delay to play video at normal speed
+    screencap.writer = writer
+    store = None
+    if prog_options.sqlite_db:
+        store = SessionStore(prog_options.sqlite_db)
+    for recovered in SpreadSheet.recover(prog_options.out_dir, store):
+        print(f"Recovered unfinished session into {recovered}")
+    sheet = SpreadSheet(prog_options.out_dir, system_date_time, headers,
+                        store=store, video=infile_path)
+
+    # Pace playback to the video's fps
     cap = cv2.VideoCapture(infile_path) #create Video Capture object
     fps = cap.get(cv2.CAP_PROP_FPS) #get fps of cap input
     if fps == 0:
         fps = 25 #set default if determination fails
-    delay = int(1000 / fps) #calculate delay from fps, in ms
-    '''
-    Note about delay: It's about 20% slower than real time...even though
-    this 100% should work. Might have a possible fix in the works.
-    '''
+    delay = int(1000 / fps) #key polling interval while paused, in ms
+    clock = PlaybackClock(fps, prog_options.speed)
+
+    timestamps = TimestampReader(make_ocr_engine(prog_options.ocr_backend))
+    prefetcher = None
+    if prog_options.prefetch_timestamps:
+        timestamps = prefetcher = TimestampPrefetcher(timestamps)
+    if prog_options.timestamp_mode == 'extrapolate':
+        timestamps = TimestampExtrapolator(timestamps, fps,
+                                           prog_options.verify_interval)
+        timestamps.step = clock.step
 
     # Set up video window
     w_width, w_height, v_width, v_height = get_window_and_video_dims(cap)
+    coord.set_frame_size(v_width, v_height)
     window_name = 'Video'
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL) #named window to display cap
     cv2.resizeWindow(window_name, width=w_width, height=w_height)
 
     paused = False
-    callback_params = coord, anno, sheet
+    release_shown = None #unpins the frame on screen
+    history = FrameReader.frames_for_budget(cap, prog_options.rewind_memory_mb,
+                                            prog_options.decode_queue_size)
+    reader = FrameReader(cap, prog_options.decode_queue_size, clock.step,
+                         history)
+    print(f"Keeping last {history / fps:.1f} s of frames for stepping back")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if prog_options.seek_index:
+        reader.index = SeekIndex(infile_path)
+        # Without PyAV the scan decodes the whole video, competing with
+        # playback, so it waits until going to a time needs it
+        if (SeekIndex.keyframes_available() and
+                reader.index.build_in_background(prog_options.ocr_backend)):
+            print('Indexing video for seeking in the background...')
+    if clock.speed != 1:
+        cv2.setWindowTitle(window_name, f"{window_name} ({clock.speed:g}x)")
+    pipeline = ClickPipeline(coord, sheet, timestamps)
+    display = Display((v_width, v_height), (w_width, w_height),
+                      prog_options.render_at_window_size)
+    callback_params = coord, anno, pipeline, timestamps, display
     cv2.setMouseCallback(window_name, mouse_input, param=callback_params)
 
 
     try:
         while cap.isOpened():
-            #frame_start_time = time.time()
-
             if not paused:
-                ret, anno.frame = cap.read() #get cap frame-by-frame
+                ret, anno.frame, anno.frame_index = reader.read()
                 if not ret: break
-
-            #timing while True here, everything else gets indented?
-            #might need to rework pause
-                
-                # Get LSByte of keypress for cross-platform compatibility
-                key_press = cv2.waitKey(delay) & 0xFF
-                if not anno.typing:
-                    if key_press == exit_key: #quit program
-                        break
-                    if anno.write_anno:
-                        anno.write_anno = False
-                        cv2.imwrite(str(anno), frame_copy)
-                    if time.time() - anno.enter_time > duration:
-                        anno.show_anno = False
-                        anno.anno_text = ''
-
-                if not screencap.captured:
-                    if key_press == screencap_key:
-                        screencap.save_frame(anno.frame,
-                                             get_timestamp(anno.frame)[1])
-                if screencap.captured:
-                    cv2.putText(anno.frame, 'Screencap saved!', (500, 500),
-                                font.font, font.scale,
-                                font.color, font.thickness)
-                    if time.time() - screencap.capture_time > 1.15:
-                        screencap.captured = False
+                if not reader.replaying: #seen before if replayed
+                    timestamps.observe(anno.frame, anno.frame_index)
+                wait = clock.schedule(anno.frame_index)
+                if wait < 0: continue #behind real time; drop frame
+            else:
+                wait = delay
+
+            # Get LSByte of keypress for cross-platform compatibility
+            key_press = cv2.waitKey(wait) & 0xFF
+            if not anno.typing:
+                if key_press == exit_key: #quit program
+                    break
+                if key_press == pause_key:
+                    paused = not paused
+                    if paused:
+                        reader.pause() #stop decoding ahead
+                        clock.reset()
+                    else:
+                        reader.resume()
+                if key_press == undo_key: #multi-level undo
+                    coord.coord = () #may be the row being undone
+                    pipeline.submit_undo()
+                elif key_press == redo_key:
+                    pipeline.submit_redo()
+                if key_press == goto_key and anno.shown_frame is not None:
+                    text = prompt_text(window_name, display, anno.shown_frame,
+                                       anno.shown_index,
+                                       'Go to (frame or '
+                                       '[DD/MM/YYYY ]HH:MM:SS): ',
+                                       font)
+                    target = None
+                    if text:
+                        target = parse_goto(text, timestamps.read(
+                            anno.shown_frame, anno.shown_index)[0])
+                    if isinstance(target, int) and 0 <= target < frame_count:
+                        reader.seek(target)
+                    elif isinstance(target, datetime.datetime):
+                        target = reader.seek_time(target)
+                        if (reader.index is not None and
+                                reader.index.build_in_background(
+                                    prog_options.ocr_backend)):
+                            print('Indexing video for seeking in the '
+                                  'background; try again when it is done')
+                    else:
+                        target = None
+                    if text and target is None:
+                        print(f"Can't go to {text!r}")
+                    elif target is not None:
+                        coord.coord = ()
+                        clock.reset()
+                        if paused: #show frame jumped to
+                            ret, anno.frame, anno.frame_index = (
+                                reader.step_forward())
+                            if not ret: break
+                            timestamps.observe(anno.frame, anno.frame_index)
+                if key_press in (step_back_key, rewind_key):
+                    shown = reader.step_back(
+                        reader.history if key_press == rewind_key else 1)
+                    if shown is not None: #else nothing kept to go back to
+                        anno.frame, anno.frame_index = shown
+                        coord.coord = ()
+                        clock.reset() #rewind keeps playing from there
+                    if key_press == step_back_key and not paused:
+                        paused = True
+                        reader.pause()
+                elif key_press == step_forward_key:
+                    if not paused:
+                        paused = True
+                        reader.pause()
+                        clock.reset()
+                    ret, anno.frame, anno.frame_index = reader.step_forward()
+                    if not ret: break
+                    coord.coord = ()
+                    if not reader.replaying:
+                        timestamps.observe(anno.frame, anno.frame_index)
+                if key_press in (slower_key, faster_key):
+                    speeds = sorted({*PLAYBACK_SPEEDS, clock.speed})
+                    i = speeds.index(clock.speed)
+                    i += 1 if key_press == faster_key else -1
+                    clock.set_speed(speeds[max(0, min(i, len(speeds) - 1))])
+                    reader.step = clock.step #applies to frames not yet queued
+                    if isinstance(timestamps, TimestampExtrapolator):
+                        timestamps.step = clock.step
+                    cv2.setWindowTitle(window_name,
+                                       f"{window_name} ({clock.speed:g}x)")
+                if anno.write_anno:
+                    anno.write_anno = False
+                    writer.write(str(anno), anno_image) #copy made on Enter
+                if time.time() - anno.enter_time > duration:
+                    anno.show_anno = False
+                    anno.anno_text = ''
+
+            if not screencap.captured and anno.shown_frame is not None:
+                if key_press == screencap_key:
+                    # Pin the frame's buffer until written; copy it instead
+                    # if overlays are drawn on it (not scaling)
+                    frame = anno.shown_frame
+                    done = reader.pin(frame) if display.scaled else None
+                    if done is None: frame = frame.copy()
+                    screencap.save_frame(frame, timestamps.read(
+                        anno.shown_frame, anno.shown_index)[1], done)
 
             # Prevent coords from popping back up after annotation is entered
             if anno.typing: coord.coord = ()
 
             # Only allow deletion of [date, time, coord] when on screen
-            if coord.coord:
-                frame_copy = anno.frame.copy() #clearing looks better
-                if key_press == clear_key:
-                    coord.coord = ()
-                    sheet.delete_last_coordinate()
-                elif (time.time() - coord.start_time < duration): #coord timeout
-                    if paused:
-                        cv2.putText(frame_copy, str(coord.coord),
-                                    coord.coord, font.font, font.scale,
-                                    font.color, font.thickness)
-                    else:
-                        cv2.putText(anno.frame, str(coord.coord),
-                                    coord.coord, font.font, font.scale,
-                                    font.color, font.thickness)
+            if coord.coord and key_press == clear_key:
+                coord.coord = ()
+                pipeline.submit_clear(coord.click_id)
+            show_coord = (coord.coord and
+                          time.time() - coord.start_time < duration) #timeout
+
+            # Overlays go on a canvas at window size (the frame itself when
+            # not scaling), and are cleared off it once shown
+            canvas = display.render(anno.frame, anno.frame_index)
+            if screencap.captured:
+                display.put_text(canvas, 'Screencap saved!', (500, 500), font)
+                if time.time() - screencap.capture_time > 1.15:
+                    screencap.captured = False
+            if show_coord:
+                display.put_text(canvas, str(coord.coord), coord.coord, font)
 
             # This while loop ensures that the video is paused while annotating
+            if anno.typing: display.clear(canvas)
             while anno.typing:
-                frame_copy = anno.frame.copy() #makes backspace work when typing
-
                 if anno.show_anno:
-                    cv2.putText(frame_copy, anno.anno_text, anno.anno_pos,
-                                font.font, font.scale, font.color,
-                                font.thickness)
-                    cv2.imshow(window_name, frame_copy)
+                    display.put_text(canvas, anno.anno_text, anno.anno_pos,
+                                     font)
+                    cv2.imshow(window_name, canvas)
+                    display.clear(canvas) #makes backspace work when typing
 
                 key_press = cv2.waitKey(0) & 0xFF #LSByte for cross-plat compat
                 if key_press != 255:
@@ -704,6 +3473,10 @@ def main():
                         anno.typing = False
                         anno.write_anno = True
                         anno.enter_time = time.time()
+                        anno_image = anno.frame.copy() #full resolution
+                        cv2.putText(anno_image, anno.anno_text, anno.anno_pos,
+                                    font.font, font.scale, font.color,
+                                    font.thickness)
                     elif key_press == 27: #Esc
                         anno.typing = False
                         anno.show_anno = False
@@ -716,17 +3489,17 @@ def main():
                         anno.show_anno = True
 
             if anno.show_anno:
-                if paused:
-                    cv2.putText(frame_copy, anno.anno_text, anno.anno_pos,
-                                font.font,font.scale, font.color,
-                                font.thickness)
-                else:
-                    cv2.putText(anno.frame, anno.anno_text, anno.anno_pos,
-                                font.font, font.scale, font.color,
-                                font.thickness)
+                display.put_text(canvas, anno.anno_text, anno.anno_pos, font)
+
+            cv2.imshow(window_name, canvas) #show video frame
+            display.clear(canvas) #imshow keeps its own copy
 
-            if not(paused and (coord.coord or anno.show_anno)):
-                cv2.imshow(window_name, anno.frame) #show video frame
+            # Dropped frames move anno.frame past the frame on screen, so
+            # keep the shown one (and its slot) for clicks, screencaps, go-to
+            release = reader.pin(anno.frame)
+            if release_shown is not None: release_shown()
+            release_shown = release
+            anno.shown_frame, anno.shown_index = anno.frame, anno.frame_index
 
 
     except Exception as e:
@@ -736,9 +3509,26 @@ def main():
 
     finally:
         # destroy cv2 windows if initialized
+        if 'reader' in locals():
+            reader.stop() #stop decoding before releasing capture
+            print(f"Decoded {reader.frames_decoded} frames, "
+                  f"{reader.decode_time * 1000:.1f} ms/frame")
+            print(f"Played at {clock.achieved_fps:.1f} fps (video: "
+                  f"{clock.fps:.1f} fps), dropped {clock.dropped} frames")
+            peak = peak_memory_mb()
+            if peak is not None:
+                print(f"Peak memory: {peak:.0f} MB; {reader.allocations} "
+                      "frames decoded outside the buffer pool")
         if 'cap' in locals() or 'cap' in globals():
             cap.release() #release video capture object
             cv2.destroyAllWindows() #close all OpenCV windows
+        pipeline.close() #save clicks still in flight
+        writer.close() #write images still queued
+        if prefetcher is not None:
+            prefetcher.stop() #stop background OCR thread
+        sheet.close() #write final .xlsx
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":
@@ -70,6 +70,33 @@ TOptionmenu = TypeVar('TOptionmenu', bound=ttk.OptionMenu)
 TStringVar = TypeVar('TStringVar', bound=tk.StringVar)
 TBooleanVar = TypeVar('TBooleanVar', bound=tk.BooleanVar)
 
+# Defaults for options that older .options.json files may not have; Save
+# writes them out, and keys without a GUI field are checked against them
+OPTION_DEFAULTS = {
+    'ocr_backend': 'auto',
+    'timestamp_mode': 'ocr',
+    'verify_interval': 60.0,
+    'prefetch_timestamps': True,
+    'undo_key': 'u',
+    'redo_key': 'r',
+    'speed': 1.0,
+    'slower_key': '[',
+    'faster_key': ']',
+    'goto_key': 'g',
+    'seek_index': True,
+    'render_at_window_size': True,
+    'image_format': 'jpg',
+    'jpeg_quality': 95,
+    'png_compression': 3,
+    'webp_quality': 95,
+    'rewind_memory_mb': 512,
+    'step_back_key': ',',
+    'step_forward_key': '.',
+    'rewind_key': 'b',
+    'sqlite_db': '',
+    'decode_queue_size': 8,
+} # type: dict[str, Any]
+
 
 class QuadViewer:
     def __init__(self, root, video_file, quads_file, frame_skip) -> None:
@@ -203,6 +230,9 @@ class QuadViewer:
         self.canvas.unbind('<ButtonRelease-1>') #left-click
         self.coords_label.place_forget() #make label disappear
         self._update_image()
+        # Record resolution so chicken_map can map other resolutions of video
+        height, width = self.original_frame.shape[:2]
+        self.quads_dict['frame_size'] = [width, height]
         write_args_to_file(self.quads_dict, self.quads_file)
         # ^defined outside class. don't like but it'll work
         #I don't feel like making it know what quad changed, so I'm updating all
@@ -323,8 +353,9 @@ def save_options(root: TRoot, option_vars: list[Any], label_ack: TLabel,
 
     if err_msgs_left or err_msgs_right: return #if invalid input, don't submit
 
-    # Rename options for output
-    args = {} # type: dict[str, str | float | int | bool | tuple[int, int, int]]
+    # Rename options for output; keep options without a GUI field
+    args = {**OPTION_DEFAULTS,
+            **get_args_from_file(options_file)} # type: dict[str, Any]
     args['video_path'] = option_vars[0].get()
     if option_vars[1].get():
         args['three_d'] = option_vars[2].get()
@@ -600,7 +631,7 @@ def validate_thickness(var: TStringVar, font_vars: list[TStringVar],
 
 def validate_keys(err_msgs_left: dict[str, str], label_err: TLabel,
                   approved_keys: str, key_vars: list[TStringVar],
-                  key_widgets: list[TEntry]) -> None:
+                  key_widgets: list[TEntry], fixed_keys: list[str]) -> None:
     """Callback wrapper func to check all key inputs for invalid/repeated keys.
 
     Args:
@@ -609,10 +640,11 @@ def validate_keys(err_msgs_left: dict[str, str], label_err: TLabel,
         approved_keys: valid key choices
         key_vars: all key vars
         key_widgets: all key widgets
+        fixed_keys: keys without a GUI field (undo, redo, etc.)
     """
 
-    # Generate all current key values
-    key_var_vals = [key_var.get() for key_var in key_vars]
+    # Generate all current key values, plus keys set outside the GUI
+    key_var_vals = [key_var.get() for key_var in key_vars] + fixed_keys
 
     validate_key(key_var_vals[0], 'Exit Key', err_msgs_left, label_err,
                  approved_keys, key_var_vals[1:], key_widgets[0])
@@ -779,8 +811,11 @@ def main():
 
     options_file = '.options.json'
     quads_file = '.quads.json'
-    saved_args = get_args_from_file(options_file)
+    saved_args = {**OPTION_DEFAULTS, **get_args_from_file(options_file)}
     video_file = saved_args['video_path']
+    gui_keys = ('exit_key', 'clear_key', 'pause_key', 'screencap_key')
+    fixed_keys = [val for name, val in saved_args.items()
+                  if name.endswith('_key') and name not in gui_keys]
     frame_skip = 125 #skip ahead 125 frames (should be 5 seconds)
     #quads = [
     #    [[1185, 200], [1480, 185], [2475, 1520], [1030, 1520]], #floor
@@ -877,7 +912,7 @@ def main():
     exit_key_var.trace_add('write',
                            lambda *args: validate_keys(
                                err_msgs_right, label_err_right, approved_keys,
-                               key_vars, key_widgets))
+                               key_vars, key_widgets, fixed_keys))
     option_vars.append(exit_key_var)
 
     label_clear_key = ttk.Label(frame, text='Clear key:')
@@ -891,7 +926,7 @@ def main():
     clear_key_var.trace_add('write',
                             lambda *args: validate_keys(
                                 err_msgs_right, label_err_right, approved_keys,
-                                key_vars, key_widgets))
+                                key_vars, key_widgets, fixed_keys))
     option_vars.append(clear_key_var)
 
     label_pause_key = ttk.Label(frame, text='Pause key:')
@@ -905,7 +940,7 @@ def main():
     pause_key_var.trace_add('write',
                             lambda *args: validate_keys(
                                 err_msgs_right, label_err_right, approved_keys,
-                                key_vars, key_widgets))
+                                key_vars, key_widgets, fixed_keys))
     option_vars.append(pause_key_var)
 
     label_screencap_key = ttk.Label(frame, text='Screencap key:')
@@ -919,7 +954,7 @@ def main():
     screencap_key_var.trace_add('write',
                                 lambda *args: validate_keys(
                                     err_msgs_right, label_err_right, approved_keys,
-                                    key_vars, key_widgets))
+                                    key_vars, key_widgets, fixed_keys))
     option_vars.append(screencap_key_var)
 
     label_duration = ttk.Label(frame, text='Coordinate duration:')
@@ -1032,6 +1067,8 @@ def main():
     canvas = tk.Canvas(frame, width=850, height=150)
     canvas.grid(row=label_err_left.grid_info()['row']+1, column=0, columnspan=4)
     update_font_preview(font_vars, canvas)
+    validate_keys(err_msgs_right, label_err_right, approved_keys, key_vars,
+                  key_widgets, fixed_keys) #saved keys may already clash
 
 
     # BUTTONS
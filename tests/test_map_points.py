@@ -0,0 +1,94 @@
+"""Checks CoordinateManager.map_points against the original per-click code.
+
+The reference below is the scalar _get_3d_from_2d() that map_points()
+replaced, vectorized but otherwise unchanged: fillPoly masks of the quads
+at calibration resolution, double roost > floor > nesting boxes > single
+roost, and the .3D_matrices homographies.
+
+map_points() classifies pixels with an exact point-in-polygon test instead
+of a rasterized mask, so pixels right on a quad's edge can land on the
+other side of it (about 0.1% of the frame). Those are allowed, but only
+within EDGE_PIXELS of an edge; everywhere else the region and the 3D
+coordinate have to match.
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import chicken_map # noqa: E402
+
+EDGE_PIXELS = 1 #how far from a quad edge a pixel may change region
+GRID_STEP = 3 #test every GRID_STEP-th pixel in x and y
+
+
+def reference_map(points: np.ndarray, quads, adjusted: bool):
+    """Baseline _get_3d_from_2d(), over many points at once."""
+
+    prefix = 'adjusted_' if adjusted else ''
+    names = ('floor', 'nb', 'sr', 'dr') #order of quads
+    matrices = [np.load(os.path.join(REPO_DIR, '.3D_matrices',
+                                     f"{prefix}{name}_matrix.npy"))
+                for name in names]
+    quads = np.array(quads, np.int32)
+    width, height = chicken_map.CALIBRATION_SIZE
+
+    x_meas, y_meas, nesting_boxes = 3.04, 10.54, 0.51
+    # x scale numerator, y scale numerator, x offset, y offset, est_z
+    scales = [(x_meas, y_meas, nesting_boxes, 0.0, 0.2),
+              (nesting_boxes, y_meas, 0.0, 0.0, 0.2),
+              (1, 3.54, nesting_boxes + 2, 7.0, 0.4),
+              (1, 6.5, nesting_boxes + 2, 0.0, 0.6)]
+
+    regions = np.full(len(points), -1)
+    world = np.full((len(points), 3), -1.0)
+    for region in (3, 0, 1, 2): #double roost takes priority over floor
+        mask = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(mask, [quads[region]], 255)
+        hits = (regions == -1) & (mask[points[:, 1], points[:, 0]] == 255)
+        regions[hits] = region
+
+        bb_x, bb_y = quads[region].max(axis=0) - quads[region].min(axis=0)
+        x_num, y_num, x_offset, y_offset, est_z = scales[region]
+        pixels = np.column_stack((points[hits], np.ones(hits.sum())))
+        trans_pixels = pixels @ matrices[region].T
+        trans_pixels /= trans_pixels[:, 2:]
+        world[hits, 0] = trans_pixels[:, 0] * (x_num / bb_x) + x_offset
+        world[hits, 1] = trans_pixels[:, 1] * (y_num / bb_y) + y_offset
+        world[hits, 2] = est_z
+
+    return world, regions
+
+
+def near_edges(points: np.ndarray, quads) -> np.ndarray:
+    width, height = chicken_map.CALIBRATION_SIZE
+    edges = np.zeros((height, width), np.uint8)
+    for quad in quads:
+        cv2.polylines(edges, [np.array(quad, np.int32)], True, 255,
+                      2 * EDGE_PIXELS + 1)
+    return edges[points[:, 1], points[:, 0]] == 255
+
+
+@pytest.mark.parametrize('adjusted', [False, True])
+def test_map_points_matches_fillpoly_reference(adjusted):
+    quads = chicken_map.DEFAULT_QUADS
+    coord = chicken_map.CoordinateManager(
+        'Floor', np.array(quads) if adjusted else False)
+    width, height = chicken_map.CALIBRATION_SIZE
+    ys, xs = np.mgrid[0:height:GRID_STEP, 0:width:GRID_STEP]
+    points = np.column_stack((xs.ravel(), ys.ravel()))
+
+    world, regions = coord.map_points(points, adjusted=adjusted)
+    ref_world, ref_regions = reference_map(points, quads, adjusted)
+
+    moved = regions != ref_regions
+    assert not (moved & ~near_edges(points, quads)).any()
+    assert moved.mean() < 0.002
+    np.testing.assert_allclose(world[~moved], ref_world[~moved],
+                               rtol=1e-9, atol=1e-9)